@@ -1,27 +1,77 @@
 import logging
 import tempfile
+import threading
 import time
+from functools import wraps
 
 from qm.QuantumMachinesManager import QuantumMachinesManager
 from qm import SimulationConfig
 from exopy_hqc_legacy.instruments.drivers.driver_tools import BaseInstrument
 
+from exopy_qm.utils.calibration import CalibrationTable
+from exopy_qm.utils.config_tools import compact_config
+
 logger = logging.getLogger(__name__)
 
+#: Name of the machine used when no name is specified
+DEFAULT_MACHINE = ''
+
 
 def requires_config(func):
-    def wrapper(self, *args, **kwargs):
-        if self.qmObj:
-            return func(self, *args, **kwargs)
+    @wraps(func)
+    def wrapper(self, *args, machine=DEFAULT_MACHINE, **kwargs):
+        if machine in self.machines:
+            return func(self, *args, machine=machine, **kwargs)
         else:
             logger.error(
                 "Couldn't run the QUA program because no configuration was set"
+                + (f" for the machine {machine}" if machine else "")
             )
 
     return wrapper
 
 
+def _configured_values(config):
+    """Intermediate frequencies and mixer corrections set by a config.
+
+    The keys are the ones used by the cache of the applied values.
+
+    """
+    values = {}
+    for qe, element in config.get('elements', {}).items():
+        if 'intermediate_frequency' in element:
+            values[('if', qe)] = element['intermediate_frequency']
+    for mixer, entries in config.get('mixers', {}).items():
+        for entry in entries:
+            try:
+                key = ('mixer', mixer, entry['intermediate_frequency'],
+                       entry['lo_frequency'])
+                values[key] = tuple(float(v) for v in entry['correction'])
+            except (KeyError, TypeError):
+                continue
+    return values
+
+
 class QuantumMachine(BaseInstrument):
+    """Driver managing one or several quantum machines of a cluster.
+
+    Each quantum machine is opened under a name by set_config and all the
+    methods acting on a machine or its current job accept a machine
+    keyword argument selecting it. The unnamed machine ('') is the one
+    used by default and the only one opened with close_other_machines.
+
+    Different machines can be driven from different threads (for example
+    tasks executed in parallel by exopy), which allows to run independent
+    programs on separate controllers at the same time.
+
+    The mixer corrections and intermediate frequencies last applied to
+    each machine are cached and identical values are not sent again.
+    Setting the configuration of a machine restores the values of the
+    configuration, the cache is then reset to those values. A
+    calibration table loaded with load_calibration allows set_frequencies
+    to compute the mixer corrections of several elements at once.
+
+    """
 
     caching_permissions = {}
 
@@ -50,8 +100,36 @@ class QuantumMachine(BaseInstrument):
             self.qmm = QuantumMachinesManager()
 
 
-        self.qmObj = None
-        self.job = None
+        #: Quantum machines opened by the driver, by name
+        self.machines = {}
+
+        #: Current job of each machine, by name
+        self.jobs = {}
+
+        #: Configuration set on each machine, by name
+        self.configs = {}
+
+        #: Mixer corrections calibration table used by set_frequencies
+        self.calibration = None
+
+        #: Values last applied to each machine, by name
+        self._applied = {}
+
+        self._lock = threading.RLock()
+
+    @property
+    def qmObj(self):
+        """Quantum machine opened without specifying a name.
+
+        """
+        return self.machines.get(DEFAULT_MACHINE)
+
+    @property
+    def job(self):
+        """Current job of the default machine.
+
+        """
+        return self.jobs.get(DEFAULT_MACHINE)
 
     def connect(self):
         """
@@ -64,24 +142,89 @@ class QuantumMachine(BaseInstrument):
         """Return whether or not commands can be sent to the instrument
         """
         try:
-            print(self.qmObj.list_controllers())
+            logger.debug(f"Controllers: {self.qmObj.list_controllers()}")
         except Exception:
             return False
 
         return True
 
     def close_connection(self):
-        if self.qmObj:
-            self.qmObj.close()
+        with self._lock:
+            for qm in self.machines.values():
+                qm.close()
+            self.machines.clear()
+            self.jobs.clear()
+            self.configs.clear()
+            self._applied.clear()
 
     def clear_all_job_results(self):
         self.qmm.clear_all_job_results()
 
-    def set_config(self, config):
-        self.qmObj = self.qmm.open_qm(config, close_other_machines=True)
+    def clear_job_results(self, machine=DEFAULT_MACHINE):
+        """Clear the job results kept by the manager for a machine.
+
+        The manager only allows to clear the results of all the jobs at
+        once, so the results are cleared only if no other machine is
+        opened, since clearing them would break the jobs running in
+        parallel on the other machines.
+
+        """
+        with self._lock:
+            others = [name for name in self.machines if name != machine]
+            if others:
+                logger.debug(f"Job results not cleared for the machine "
+                             f"{machine!r}, the machines {others} are "
+                             f"opened")
+                return
+            self.qmm.clear_all_job_results()
+
+    def set_config(self, config, machine=DEFAULT_MACHINE, compact=False):
+        """Open a quantum machine with the given configuration.
+
+        The machine previously opened under the same name is closed.
+        Other machines are only closed when opening the default machine
+        while no named machine is in use.
+
+        If compact is True, duplicated waveforms are merged and constant
+        arbitrary waveforms replaced by constant ones before the upload
+        (see exopy_qm.utils.config_tools.compact_config). The statistics
+        of the compaction are returned in that case.
+
+        """
+        stats = None
+        if compact:
+            config, stats = compact_config(config)
+            if stats['waveforms'] != stats['compacted_waveforms']:
+                logger.info(
+                    f"Configuration compacted from {stats['waveforms']} to "
+                    f"{stats['compacted_waveforms']} waveforms "
+                    f"({stats['merged']} merged, {stats['constants']} made "
+                    f"constant), about {stats['bytes_saved']} bytes saved")
+            if stats['scaled_copies']:
+                logger.info(f"{stats['scaled_copies']} waveforms are scaled "
+                            f"copies of other ones and could be replaced by "
+                            f"amplitude scaling in the program")
+
+        with self._lock:
+            previous = self.machines.pop(machine, None)
+            self.jobs.pop(machine, None)
+            close_others = (machine == DEFAULT_MACHINE
+                            and not self.machines)
+            if previous is not None and not close_others:
+                previous.close()
+            if close_others:
+                self.configs.clear()
+                self._applied.clear()
+            self.machines[machine] = self.qmm.open_qm(
+                config, close_other_machines=close_others)
+            self.configs[machine] = config
+            self._applied[machine] = _configured_values(config)
+
+        return stats
 
     @requires_config
-    def execute_program(self, prog, duration_limit=0, data_limit=0):
+    def execute_program(self, prog, duration_limit=0, data_limit=0,
+                        machine=DEFAULT_MACHINE):
         """Create a job on the OPX to execute a program.
 
         The duration_limit and data_limit arguments specify the
@@ -89,95 +232,257 @@ class QuantumMachine(BaseInstrument):
         stopped by the server. Those limits are disabled by default.
 
         """
-        self.job = self.qmObj.execute(prog,
-                                      duration_limit=duration_limit,
-                                      data_limit=data_limit,
-                                      force_execution=True)
+        self.jobs[machine] = self.machines[machine].execute(
+            prog, duration_limit=duration_limit, data_limit=data_limit,
+            force_execution=True)
 
     @requires_config
-    def simulate_program(self, prog, duration):
+    def queue_program(self, prog, machine=DEFAULT_MACHINE):
+        """Add a program to the queue of the machine.
+
+        The program is compiled and uploaded while the current job runs
+        and starts as soon as the jobs before it are done. The returned
+        pending job should be passed to wait_for_job to make it the
+        current job of the machine.
+
+        """
+        return self.machines[machine].queue.add(prog)
+
+    @requires_config
+    def wait_for_job(self, pending_job, machine=DEFAULT_MACHINE):
+        """Wait for a queued job to start and make it the current job.
+
+        """
+        job = pending_job.wait_for_execution()
+        self.jobs[machine] = job
+        return job
+
+    def cancel_job(self, pending_job):
+        """Remove a job from the queue if it did not start yet.
+
+        """
+        try:
+            pending_job.cancel()
+        except Exception as e:
+            logger.warning(f"Couldn't cancel the queued job: {e}")
+
+    @requires_config
+    def simulate_program(self, prog, duration, machine=DEFAULT_MACHINE):
         """ Simulate the program on the OPX
 
         The duration parameter specifies the number of FPGA cycles
         of the simulation (4ns/cycle).
         This functions opens a matplotlib popup with the results.
         """
-        self.job = self.qmObj.simulate(prog, SimulationConfig(
+        job = self.machines[machine].simulate(prog, SimulationConfig(
             duration=duration,
             include_analog_waveforms=True))
-        samples = self.job.get_simulated_samples()
+        self.jobs[machine] = job
+        samples = job.get_simulated_samples()
         samples.con1.plot(digital_ports=(0,))
         import matplotlib.pyplot as plt
         plt.show()
 
-    def is_paused(self):
-        return self.job.is_paused()
+    def simulate(self, config, prog, duration):
+        """Simulate a program for a configuration and return the job.
+
+        No quantum machine is opened, so this can be called from several
+        threads at once to run simulations concurrently. The duration is
+        given in FPGA cycles (4ns/cycle).
+
+        """
+        return self.qmm.simulate(config, prog, SimulationConfig(
+            duration=duration, include_analog_waveforms=True))
+
+    def is_paused(self, machine=DEFAULT_MACHINE):
+        return self.jobs[machine].is_paused()
 
-    def resume(self):
-        self.job.resume()
+    def resume(self, machine=DEFAULT_MACHINE):
+        self.jobs[machine].resume()
 
-    def wait_for_pause(self):
+    def wait_for_pause(self, machine=DEFAULT_MACHINE):
         """waits for the program to be paused
         """
-        while not self.is_paused():
+        while not self.is_paused(machine=machine):
             time.sleep(0.01)
         
-    def iterate(self):
+    def iterate(self, machine=DEFAULT_MACHINE):
         """Iterates the program by resuming it and feeding True to the input sting 'iterate' 
         """
-        self.job.resume()
-        self.job.insert_input_stream('iterate', True)
+        job = self.jobs[machine]
+        job.resume()
+        job.insert_input_stream('iterate', True)
 
-    def finish(self):
+    def finish(self, machine=DEFAULT_MACHINE):
         """Finishes the program by resuming it and feeding False to the input sting 'iterate'
           """
-        self.job.resume()
-        self.job.insert_input_stream('iterate', False)
+        job = self.jobs[machine]
+        job.resume()
+        job.insert_input_stream('iterate', False)
 
     @requires_config
-    def set_output_dc_offset_by_qe(self, element, input, offset):
-        self.qmObj.set_output_dc_offset_by_element(element, input, offset)
+    def set_output_dc_offset_by_qe(self, element, input, offset,
+                                   machine=DEFAULT_MACHINE):
+        self.machines[machine].set_output_dc_offset_by_element(element, input,
+                                                               offset)
 
     @requires_config
-    def set_input_dc_offset_by_qe(self, element, output, offset):
-        self.qmObj.set_input_dc_offset_by_element(element, output, offset)
+    def set_input_dc_offset_by_qe(self, element, output, offset,
+                                  machine=DEFAULT_MACHINE):
+        self.machines[machine].set_input_dc_offset_by_element(element, output,
+                                                              offset)
 
     @requires_config
-    def wait_for_all_results(self, ):
+    def wait_for_all_results(self, machine=DEFAULT_MACHINE):
         """Wait for the current job to be completed.
         """
-        self.job.result_handles.wait_for_all_values()
+        self.jobs[machine].result_handles.wait_for_all_values()
 
     @requires_config
-    def get_results(self, path=None):
-        return self.job.result_handles
+    def is_processing(self, machine=DEFAULT_MACHINE):
+        """Return whether the current job is still producing results.
+        """
+        return self.jobs[machine].result_handles.is_processing()
+
+    @requires_config
+    def halt(self, machine=DEFAULT_MACHINE):
+        """Stop the current job before its end.
+        """
+        self.jobs[machine].halt()
 
     @requires_config
-    def get_execution_report(self, path=None):
-        return self.job.execution_report()
+    def get_results(self, path=None, machine=DEFAULT_MACHINE):
+        return self.jobs[machine].result_handles
 
     @requires_config
-    def set_io_values(self, io1_value, io2_value):
-        self.qmObj.set_io_values(io1_value, io2_value)
+    def get_execution_report(self, path=None, machine=DEFAULT_MACHINE):
+        return self.jobs[machine].execution_report()
 
     @requires_config
-    def get_io_values(self):
-        return self.qmObj.get_io_values()
+    def set_io_values(self, io1_value, io2_value, machine=DEFAULT_MACHINE):
+        self.machines[machine].set_io_values(io1_value, io2_value)
+
+    @requires_config
+    def get_io_values(self, machine=DEFAULT_MACHINE):
+        return self.machines[machine].get_io_values()
 
     @requires_config
     def set_mixer_correction(self, mixer, intermediate_frequency, lo_frequency,
-                             values):
-        self.qmObj.set_mixer_correction(mixer, intermediate_frequency,
-                                        lo_frequency, values)
+                             values, machine=DEFAULT_MACHINE):
+        """Set the correction matrix of a mixer for an IF/LO pair.
+
+        Nothing is sent if the same matrix was the last one applied.
+        Returns whether the matrix was sent.
+
+        """
+        values = tuple(float(v) for v in values)
+        key = ('mixer', mixer, intermediate_frequency, lo_frequency)
+        applied = self._applied[machine]
+        if applied.get(key) == values:
+            return False
+        self.machines[machine].set_mixer_correction(
+            mixer, intermediate_frequency, lo_frequency, values)
+        applied[key] = values
+        return True
+
+    @requires_config
+    def set_intermediate_frequency(self, qe, intermediate_frequency,
+                                   machine=DEFAULT_MACHINE):
+        """Set the IF of an element, unless it is already the current one.
+
+        Returns whether the frequency was sent.
+
+        """
+        key = ('if', qe)
+        applied = self._applied[machine]
+        if applied.get(key) == intermediate_frequency:
+            return False
+        self.machines[machine].set_intermediate_frequency(
+            qe, intermediate_frequency)
+        applied[key] = intermediate_frequency
+        return True
+
+    def load_calibration(self, path):
+        """Load the calibration table used by set_frequencies.
+
+        See exopy_qm.utils.calibration.CalibrationTable.load for the
+        supported formats.
+
+        """
+        self.calibration = CalibrationTable.load(path)
 
     @requires_config
-    def set_intermediate_frequency(self, qe, intermediate_frequency):
-        self.qmObj.set_intermediate_frequency(qe, intermediate_frequency)
+    def set_frequencies(self, intermediate_frequencies, lo_frequencies=None,
+                        machine=DEFAULT_MACHINE):
+        """Set the IF of several elements along with their mixer correction.
+
+        The mixer and LO frequency of each element are read from the
+        configuration of the machine, the LO frequencies can be
+        overridden to follow an external LO. The corrections are
+        interpolated from the calibration table for all the elements
+        sharing a mixer and LO at once and only the values which changed
+        since the last call are sent.
+
+        Parameters
+        ----------
+        intermediate_frequencies : dict
+            Mapping between element names and their IF in Hz.
+
+        lo_frequencies : dict, optional
+            Mapping between element names and the LO frequency in Hz.
+
+        Returns
+        -------
+        sent : int
+            Number of values actually sent to the machine.
+
+        """
+        lo_frequencies = lo_frequencies or {}
+        elements = self.configs[machine].get('elements', {})
+
+        # Group the elements by mixer and LO to interpolate them together.
+        groups = {}
+        for qe, intermediate_frequency in intermediate_frequencies.items():
+            mix_inputs = elements.get(qe, {}).get('mixInputs')
+            if mix_inputs is None or 'mixer' not in mix_inputs:
+                continue
+            mixer = mix_inputs['mixer']
+            if self.calibration is None or \
+                    mixer not in self.calibration.mixers:
+                logger.warning(f"No calibration for the mixer {mixer} of "
+                               f"{qe}, only its IF is set")
+                continue
+            lo = lo_frequencies.get(qe, mix_inputs.get('lo_frequency'))
+            if lo is None:
+                raise ValueError(f"No LO frequency for the element {qe}, "
+                                 f"set it in the configuration or pass it "
+                                 f"explicitly")
+            groups.setdefault((mixer, lo), []).append(
+                (qe, intermediate_frequency))
+
+        corrections = []
+        for (mixer, lo), items in groups.items():
+            ifs = [f for _, f in items]
+            values = self.calibration.corrections(mixer, ifs, lo)
+            corrections.extend((mixer, f, lo, v) for f, v in zip(ifs, values))
+
+        sent = 0
+        with self._lock:
+            for qe, intermediate_frequency in intermediate_frequencies.items():
+                sent += self.set_intermediate_frequency(
+                    qe, intermediate_frequency, machine=machine)
+            for mixer, intermediate_frequency, lo, values in corrections:
+                sent += self.set_mixer_correction(
+                    mixer, intermediate_frequency, lo, values, machine=machine)
+
+        return sent
 
     @requires_config
-    def set_digital_delay(self, qe, digital_input, delay):
-        self.qmObj.set_digital_delay(qe, digital_input, delay)
+    def set_digital_delay(self, qe, digital_input, delay,
+                          machine=DEFAULT_MACHINE):
+        self.machines[machine].set_digital_delay(qe, digital_input, delay)
 
     @requires_config
-    def set_digital_buffer(self, qe, digital_input, buffer):
-        self.qmObj.set_digital_buffer(qe, digital_input, buffer)
+    def set_digital_buffer(self, qe, digital_input, buffer,
+                           machine=DEFAULT_MACHINE):
+        self.machines[machine].set_digital_buffer(qe, digital_input, buffer)
@@ -1,4 +1,3 @@
-import ast
 import importlib
 import importlib.util
 import logging
@@ -8,17 +7,36 @@ import numpy as np
 import time
 
 import qm.qua
-from atom.api import List, Typed, Str, Value, Bool, set_default
+from atom.api import (List, Typed, Str, Value, Bool, Enum, Float, Int,
+                      set_default)
 from exopy.tasks.api import InstrumentTask
 
-logger = logging.getLogger(__name__)
+from exopy_qm.utils.checkpoint import CheckpointStore, file_digest
+from exopy_qm.utils.config_tools import config_digest, validate_config
+from exopy_qm.utils.decimation import parse_preview_streams, preview_results
+from exopy_qm.utils.export import StreamExporter, pa
+from exopy_qm.utils.prefetch import PointPrefetcher
+from exopy_qm.utils.results import (ResultCollector, memmap_results,
+                                    parse_declared_streams,
+                                    TELEMETRY_DTYPE, SWEEP_TELEMETRY_DTYPE)
+from exopy_qm.utils.shared_results import open_publisher
+from exopy_qm.utils.simulation import (SimulationBatch, parameter_grid,
+                                       simulate_grid)
+from exopy_qm.utils.statistics import RunningStats
+from exopy_qm.utils.stream_analysis import find_streams
+from exopy_qm.utils.sweep import (QueuedJob, eval_with_overrides,
+                                  loop_indices, next_point_overrides,
+                                  runs_alone_in_loop)
 
+logger = logging.getLogger(__name__)
 
-class ParseError(Exception):
-    """ Error used to indicate a failure in the program parsing
+#: Errors found when building and validating the config and program, by
+#: digest of the files and of the parameters. Shared by all the tasks so
+#: that checking several tasks using the same files stays cheap.
+_VALIDATION_CACHE = {}
 
-    """
-    pass
+#: Maximal number of validations kept in the cache
+_VALIDATION_CACHE_SIZE = 256
 
 
 class ConfigureExecuteTask(InstrumentTask):
@@ -41,6 +59,13 @@ class ConfigureExecuteTask(InstrumentTask):
 
     The two files can be merged into one if wanted.
 
+    The program file can optionally define a get_streams(parameters)
+    function returning a dictionary mapping the name of each saved stream
+    to a (shape, dtype) tuple. Declared streams take precedence over the
+    ones inferred from the program and allow the results to be fetched
+    into a buffer allocated once for the whole measurement. The values
+    written in the database are overwritten in place at each execution.
+
     """
 
     #: Path to the python configuration file
@@ -61,19 +86,105 @@ class ConfigureExecuteTask(InstrumentTask):
     #: Comments associated with the parameters
     comments = Typed(dict).tag(pref=True)
 
+    #: Merge duplicated waveforms of the configuration before uploading it
+    compact_config = Bool(False).tag(pref=True)
+
+    #: Comma separated names of the single shot streams monitored to stop
+    #: the job early (early stopping is disabled if empty)
+    early_stop_streams = Str().tag(pref=True)
+
+    #: Quantity compared to the target to decide to stop the job
+    early_stop_criterion = Enum('standard_error', 'snr').tag(pref=True)
+
+    #: Target value of the criterion for all the points of the streams
+    early_stop_target = Str().tag(pref=True)
+
+    #: Time in s between two checks of the partial results
+    early_stop_interval = Float(0.5).tag(pref=True)
+
+    #: Save the results of each point under the save directory
+    checkpoint = Bool(False).tag(pref=True)
+
+    #: Skip the points whose results were already checkpointed
+    resume = Bool(False).tag(pref=True)
+
+    #: Format in which the streams of all the points are exported under the
+    #: save directory, the export is disabled if empty
+    export_format = Enum('', 'parquet', 'arrow').tag(pref=True)
+
+    #: Name under which the streams are published in shared memory for
+    #: external analysis processes, the publication is disabled if empty
+    shared_memory_name = Str().tag(pref=True)
+
+    #: Number of points kept in the shared memory ring buffers
+    shared_memory_slots = Int(4).tag(pref=True)
+
+    #: Comma separated names of the streams for which a decimated preview
+    #: is written in a preview_<stream> entry
+    preview_streams = Str().tag(pref=True)
+
+    #: Number of bins of the previews
+    preview_points = Int(1000).tag(pref=True)
+
+    #: Reduction applied to each bin of the previews
+    preview_method = Enum('minmax', 'mean').tag(pref=True)
+
+    #: Only write the previews of the previewed streams in the database,
+    #: their full resolution data going only to the checkpoints, exports
+    #: and shared memory (the memmap buffer only holds the last point)
+    preview_only = Bool(False).tag(pref=True)
+
+    #: Maximal size in MB of each fetch of the large streams saved with
+    #: save_all (0 to fetch each stream at once)
+    fetch_chunk_size = Int(0).tag(pref=True)
+
+    #: Folder in which the results are memory mapped instead of being
+    #: kept in memory (disabled if empty)
+    path_to_memmap = Str().tag(pref=True)
+
+    #: Build the config and program with the test values of the
+    #: parameters and validate the config when checking the measurement
+    validate_on_check = Bool(False).tag(pref=True)
+
     #: Duration of the simulation in ns
     simulation_duration = Str(default="1000").tag(pref=True)
 
     #: Doesn't wait for the program to end if this is on
     pause_mode = Bool(False).tag(pref=True)
 
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
+    #: Queue the program of the next point of the parent loop while the
+    #: current one runs (only when the configuration does not change)
+    queue_next_point = Bool(False).tag(pref=True)
+
+    #: Also queue the next point when other tasks are executed by the parent
+    #: loop between two points (they must not affect the queued program)
+    queue_with_other_tasks = Bool(False).tag(pref=True)
+
+    #: Build the configuration and program of the next point of the parent
+    #: loop in a worker process while the current one runs
+    prefetch_next_point = Bool(False).tag(pref=True)
+
     # : Create the entry which contains all the data return by the OPX in a recarray
-    database_entries = set_default({'Results': {}})
+    # : along with the fetch statistics of the last job and of the whole sweep
+    database_entries = set_default({
+        'Results': {},
+        'Telemetry': np.zeros(0, dtype=TELEMETRY_DTYPE),
+        'Sweep_telemetry': np.zeros(0, dtype=SWEEP_TELEMETRY_DTYPE),
+        'Execution_errors': []})
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._config_module = None
         self._program_module = None
+        self._streams = {}
+        self._collector = ResultCollector()
+        self._config_digest = None
+        self._queued_job = None
+        self._checkpoint_store = None
+        self._file_digests = None
         self.parameters = {}
         self.comments = {}
 
@@ -88,27 +199,105 @@ class ConfigureExecuteTask(InstrumentTask):
             msg = ('Config or program missing')
             traceback[self.get_error_path() + '-trace'] = msg
 
+        evaluated = True
         for key, value in self.parameters.items():
             try:
                 self.format_and_eval_string(value)
             except Exception as e:
+                evaluated = False
                 msg = ("Couldn't evaluate {} : {}")
                 traceback[self.get_error_path() + '-trace'] = msg.format(
                     value, e)
 
+        if (self.validate_on_check and evaluated
+                and self._config_module is not None
+                and self._program_module is not None):
+            errors = self._validate()
+            if errors:
+                test = False
+                traceback[self.get_error_path() + '-config'] = (
+                    '\n'.join(errors))
+
+        if self.checkpoint and not self.path_to_save:
+            test = False
+            traceback[self.get_error_path() + '-checkpoint'] = (
+                'Checkpointing requires a save directory')
+
+        if self.export_format:
+            if not self.path_to_save:
+                test = False
+                traceback[self.get_error_path() + '-export'] = (
+                    'Exporting the results requires a save directory')
+            elif pa is None:
+                test = False
+                traceback[self.get_error_path() + '-export'] = (
+                    'Exporting the results requires pyarrow')
+
+        if self.fetch_chunk_size < 0:
+            test = False
+            traceback[self.get_error_path() + '-chunk'] = (
+                'The fetch chunk size cannot be negative')
+
+        if self.preview_streams and self.preview_points < 1:
+            test = False
+            traceback[self.get_error_path() + '-preview'] = (
+                'Previews require at least one point')
+
+        if (self.preview_streams and self.preview_only
+                and not (self.checkpoint or self.export_format)):
+            test = False
+            traceback[self.get_error_path() + '-preview'] = (
+                'Keeping only the previews requires checkpointing or '
+                'exporting the full resolution data')
+
+        if self.shared_memory_slots < 1:
+            test = False
+            traceback[self.get_error_path() + '-shared_memory'] = (
+                'At least one shared memory slot is required')
+
+        if self.early_stop_streams:
+            try:
+                self.format_and_eval_string(self.early_stop_target)
+            except Exception as e:
+                msg = ("Couldn't evaluate the early stopping target {} : {}")
+                traceback[self.get_error_path() + '-trace'] = msg.format(
+                    self.early_stop_target, e)
+
         return test, traceback
 
     def perform(self):
         self._update_parameters()
 
-        # Evaluate all parameters
-        evaluated_parameters = {}
-        for key, value in self.parameters.items():
-            evaluated_parameters[key] = self.format_and_eval_string(value)
-
-        config_to_set = self._config_module.get_config(evaluated_parameters)
-        program_to_execute = self._program_module.get_prog(
-            evaluated_parameters)
+        evaluated_parameters = self._evaluate_parameters()
+        parameters_digest = config_digest(evaluated_parameters)
+
+        store, point_key = None, None
+        if self.checkpoint and not self.pause_mode:
+            store = self._get_checkpoint_store()
+            if store is not None:
+                point_key = self._point_key(evaluated_parameters)
+                if self.resume and point_key in store:
+                    self._restore_point(store, point_key)
+                    return
+
+        # Use the job queued by the previous point if it was built for the
+        # same parameters.
+        queued_job = self._take_queued_job()
+        if queued_job is not None and queued_job.digest != parameters_digest:
+            queued_job.close()
+            queued_job = None
+
+        config_to_set, program_to_execute = None, None
+        if queued_job is None:
+            point = None
+            prefetcher = self.root.resources['files'].get(
+                self._prefetcher_key())
+            if prefetcher is not None:
+                point = prefetcher.take(parameters_digest)
+            if point is None:
+                point = (self._config_module.get_config(evaluated_parameters),
+                         self._program_module.get_prog(evaluated_parameters))
+            config_to_set, program_to_execute = point
 
         try:
             if self.path_to_save != "":
@@ -136,36 +325,75 @@ class ConfigureExecuteTask(InstrumentTask):
         except NotADirectoryError:
             pass
 
-        self.driver.clear_all_job_results()
-        self.driver.set_config(config_to_set)
-        self.driver.execute_program(program_to_execute)
+        self._collector.chunk_size = self.fetch_chunk_size * 2**20
+        self._collector.should_stop = self.root.should_stop
+        if self.path_to_memmap:
+            memmap_results(
+                self.root, self._collector,
+                Path(self.format_string(self.path_to_memmap)) / self.name)
+        self._collector.prepare(self._get_streams(evaluated_parameters))
+        if self.shared_memory_name:
+            self._collector.publisher = open_publisher(
+                self.root, self.format_string(self.shared_memory_name),
+                self.shared_memory_slots)
+
+        if queued_job is None:
+            self.driver.clear_job_results(machine=self.machine_name)
+            self.driver.set_config(config_to_set, machine=self.machine_name,
+                                   compact=self.compact_config)
+            if self.queue_next_point:
+                self._config_digest = config_digest(config_to_set)
+            self.driver.execute_program(program_to_execute,
+                                        machine=self.machine_name)
+        else:
+            self.driver.wait_for_job(queued_job.pending_job,
+                                     machine=self.machine_name)
+
+        queued = False
+        if self.queue_next_point and not self.pause_mode:
+            queued = self._queue_next_point()
+        if self.prefetch_next_point and not queued:
+            self._prefetch_next_point()
 
         if not self.pause_mode:
-            self.driver.wait_for_all_results()
-            results = self.driver.get_results()
-            # report = self.driver.get_execution_report()
-            # if report.has_errors():
-            #     for e in report.errors():
-            #         logger.warning(e)
-
-            dt_array = []
-            all_data = []
-            for (name, handle) in results:
-                if name.endswith('_input1') or name.endswith('_input2'):
-                    name = name[:-7]
-                all_data.append(handle.fetch_all(flat_struct=True))
-                dt_array += [(name, all_data[-1].dtype, all_data[-1].shape)]
-                try:
-                    self.write_in_database(f"variable_{name}", all_data[-1])
-                except:
-                    logger.warning(f"Unexpected variable {name}")
-                if handle.has_dataloss():
-                    logger.warning(f"{name} might have data loss")
-
-            results_recarray = np.array([tuple(all_data)], dtype=dt_array)
-            self.write_in_database('Results', results_recarray)
+            interrupted = False
+            if self.early_stop_streams:
+                repetitions, interrupted = self._wait_with_early_stop()
+                self.write_in_database('Repetitions', repetitions)
+            else:
+                self.driver.wait_for_all_results(machine=self.machine_name)
+            results = self.driver.get_results(machine=self.machine_name)
+            report = self.driver.get_execution_report(
+                machine=self.machine_name)
+
+            results_recarray = self._collector.collect(results, report)
+            self._write_results(results_recarray)
+            self._write_telemetry()
+
+            # The measurement is stopping, do not store incomplete data as
+            # a completed point.
+            if interrupted:
+                logger.warning("The point is not exported nor checkpointed "
+                               "since the job was halted before the target "
+                               "was reached")
+                return
+            if self._collector.partial:
+                logger.warning(f"The point is not exported nor "
+                               f"checkpointed since "
+                               f"{', '.join(self._collector.partial)} "
+                               f"were only partially fetched")
+                return
+
+            if self.export_format:
+                self._export(results_recarray, evaluated_parameters)
+
+            if store is not None:
+                store.save(point_key, results_recarray,
+                           {'parameters': evaluated_parameters,
+                            'indices': loop_indices(self),
+                            'files': self._file_digests})
         else:
-            self.driver.wait_for_pause()
+            self.driver.wait_for_pause(machine=self.machine_name)
 
     def refresh_config(self):
         self._post_setattr_path_to_config_file(self.path_to_config_file,
@@ -182,10 +410,7 @@ class ConfigureExecuteTask(InstrumentTask):
         """
         self._update_parameters()
 
-        # Evaluate all parameters
-        evaluated_parameters = {}
-        for key, value in self.parameters.items():
-            evaluated_parameters[key] = self.format_and_eval_string(value)
+        evaluated_parameters = self._evaluate_parameters()
 
         config_to_set = self._config_module.get_config(evaluated_parameters)
         program_to_execute = self._program_module.get_prog(
@@ -196,6 +421,48 @@ class ConfigureExecuteTask(InstrumentTask):
             driver.simulate_program(program_to_execute,
                                     duration=int(self.simulation_duration)//4)
 
+    def simulate_batch(self, grid, max_workers=4, duration=None):
+        """Simulate the program for a grid of parameters.
+
+        The configurations and programs of all the points are built first,
+        then simulated concurrently using a single driver. Is executed
+        outside of a measurement, like simulate.
+
+        Parameters
+        ----------
+        grid : dict or list
+            Either a mapping between parameter names and the values they
+            take or a list of dictionaries of parameters, see
+            exopy_qm.utils.simulation.parameter_grid. The parameters which
+            are not specified take the values entered in the task.
+
+        max_workers : int
+            Maximal number of simulations running at the same time.
+
+        duration : int, optional
+            Duration of the simulations in ns, simulation_duration by
+            default.
+
+        Returns
+        -------
+        batch : SimulationBatch
+            Stacked samples of each channel and summary of each point.
+
+        """
+        self._update_parameters()
+
+        if duration is None:
+            duration = int(self.simulation_duration)
+        parameters = parameter_grid(self._evaluate_parameters(), grid)
+        points = [(self._config_module.get_config(p),
+                   self._program_module.get_prog(p)) for p in parameters]
+
+        with self.test_driver() as driver:
+            channels, errors = simulate_grid(driver, points,
+                                             int(duration)//4, max_workers)
+
+        return SimulationBatch(parameters, channels, errors)
+
     #--------------------------Private API------------------------------#
 
     #: Module containing the configuration file
@@ -204,16 +471,39 @@ class ConfigureExecuteTask(InstrumentTask):
     #: Module containing the program file
     _program_module = Value()
 
+    #: StreamInfo of the streams found in the program file, by name
+    _streams = Value()
+
+    #: Collector fetching the results into a reusable buffer
+    _collector = Value()
+
+    #: Digest of the configuration currently set on the machine
+    _config_digest = Value()
+
+    #: Job queued for the next point of the parent loop (see QueuedJob)
+    _queued_job = Value()
+
+    #: Store holding the checkpointed points
+    _checkpoint_store = Value()
+
+    #: Digests of the config and program files identifying the points
+    _file_digests = Value()
+
+    #: Digests of the config and program files when they were imported
+    _imported_digests = Value(factory=dict)
+
+    #: Number of points exported
+    _exported_points = Int()
+
     def _post_setattr_path_to_program_file(self, old, new):
         self._program_module = None
+        self._imported_digests.pop('program', None)
 
         if new or new != '':
             importlib.invalidate_caches()
             try:
-                spec = importlib.util.spec_from_file_location(
-                    "", self.path_to_program_file)
-                program_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(program_module)
+                digest = file_digest(self.path_to_program_file)
+                program_module = _import_file(self.path_to_program_file)
             except FileNotFoundError:
                 logger.error(f"File {self.path_to_program_file} not found")
             except AttributeError:
@@ -225,20 +515,20 @@ class ConfigureExecuteTask(InstrumentTask):
                 logger.error(e)
             else:
                 self._program_module = program_module
+                self._imported_digests['program'] = digest
 
         self._update_parameters()
         self._find_variables()
 
     def _post_setattr_path_to_config_file(self, old, new):
         self._config_module = None
+        self._imported_digests.pop('config', None)
 
         if new or new != '':
             importlib.invalidate_caches()
             try:
-                spec = importlib.util.spec_from_file_location(
-                    "", self.path_to_config_file)
-                config_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(config_module)
+                digest = file_digest(self.path_to_config_file)
+                config_module = _import_file(self.path_to_config_file)
             except FileNotFoundError:
                 logger.error(f"File {self.path_to_config_file} not found")
             except AttributeError:
@@ -250,20 +540,386 @@ class ConfigureExecuteTask(InstrumentTask):
                 logger.error(e)
             else:
                 self._config_module = config_module
+                self._imported_digests['config'] = digest
 
         self._update_parameters()
 
+    def _post_setattr_preview_streams(self, old, new):
+        de = self.database_entries.copy()
+        for k in self.database_entries:
+            if k.startswith('preview_'):
+                del de[k]
+        for name in parse_preview_streams(new):
+            de[f'preview_{name}'] = np.zeros(0)
+        self.database_entries = de
+
+    def _post_setattr_early_stop_streams(self, old, new):
+        de = self.database_entries.copy()
+        if new:
+            de['Repetitions'] = 0
+        else:
+            de.pop('Repetitions', None)
+        self.database_entries = de
+
+    def _wait_with_early_stop(self):
+        """Wait for the current job, halting it once the streams converged.
+
+        The single shot values of the monitored streams saved so far are
+        fetched periodically and accumulated in running statistics. The job
+        is halted as soon as the criterion reaches the target for all the
+        points of all the streams.
+
+        Returns
+        -------
+        repetitions : int
+            Smallest number of repetitions acquired for the monitored
+            streams.
+
+        interrupted : bool
+            Whether the job was halted because the measurement is stopping,
+            the results being then incomplete.
+
+        """
+        target = self.format_and_eval_string(self.early_stop_target)
+        results = self.driver.get_results(machine=self.machine_name)
+
+        handles = {}
+        for name in self.early_stop_streams.split(','):
+            name = name.strip()
+            handle = results.get(name) if name else None
+            if handle is None:
+                logger.warning(f"Stream {name} not found, it is ignored for "
+                               f"early stopping")
+            else:
+                handles[name] = handle
+        stats = {name: RunningStats() for name in handles}
+
+        def update():
+            for name, handle in handles.items():
+                done = stats[name].count
+                count = handle.count_so_far()
+                if count > done:
+                    stats[name].update(handle.fetch(slice(done, count),
+                                                    flat_struct=True))
+
+        def converged(s):
+            if s.count < 2:
+                return False
+            if self.early_stop_criterion == 'snr':
+                return np.all(s.snr >= target)
+            return np.all(s.standard_error <= target)
+
+        should_stop = self.root.should_stop
+        interrupted = False
+        while handles and self.driver.is_processing(machine=self.machine_name):
+            if should_stop.wait(self.early_stop_interval):
+                self.driver.halt(machine=self.machine_name)
+                interrupted = True
+                break
+            update()
+            if all(converged(s) for s in stats.values()):
+                logger.info(f"Target reached after "
+                            f"{min(s.count for s in stats.values())} "
+                            f"repetitions, halting the job")
+                self.driver.halt(machine=self.machine_name)
+                break
+
+        self.driver.wait_for_all_results(machine=self.machine_name)
+        update()
+        return min((s.count for s in stats.values()), default=0), interrupted
+
+    def _validate(self):
+        """Build the config and program and validate the config.
+
+        The files modified since they were imported are imported in
+        temporary modules, the task itself being left untouched, and the
+        parameters they introduce take their default values. The result is
+        cached using the digests of the files and of the evaluated
+        parameters, so the files are only built again when one of them
+        changes.
+
+        Returns the list of the errors found.
+
+        """
+        modules, digests = {}, {}
+        try:
+            for kind in ('config', 'program'):
+                path = getattr(self, f'path_to_{kind}_file')
+                digests[kind] = file_digest(path)
+                modules[kind] = getattr(self, f'_{kind}_module')
+                if digests[kind] != self._imported_digests.get(kind):
+                    modules[kind] = _import_file(path)
+        except Exception as e:
+            return [f"Couldn't import the config and program files: {e}"]
+
+        parameters, _ = self._collect_parameters(modules['config'],
+                                                 modules['program'])
+        try:
+            parameters = {k: self.format_and_eval_string(v)
+                          for k, v in parameters.items()}
+        except Exception as e:
+            return [f"Couldn't evaluate the parameters: {e}"]
+        key = (digests['config'], digests['program'],
+               config_digest(parameters))
+
+        errors = _VALIDATION_CACHE.get(key)
+        if errors is not None:
+            return errors
+
+        errors = []
+        try:
+            config = modules['config'].get_config(parameters)
+        except Exception as e:
+            errors.append(f"get_config failed: {e}")
+        else:
+            errors.extend(validate_config(config))
+        try:
+            modules['program'].get_prog(parameters)
+        except Exception as e:
+            errors.append(f"get_prog failed: {e}")
+
+        if len(_VALIDATION_CACHE) >= _VALIDATION_CACHE_SIZE:
+            del _VALIDATION_CACHE[next(iter(_VALIDATION_CACHE))]
+        _VALIDATION_CACHE[key] = errors
+        return errors
+
+    def _get_checkpoint_store(self):
+        """Get the store of the checkpoints of the task.
+
+        Checkpoints are kept in a folder named after the task inside the
+        checkpoints folder of the save directory, so that a measurement
+        restarted with the same save directory finds them.
+
+        """
+        if self._checkpoint_store is None:
+            if not self.path_to_save:
+                return None
+            root_path = Path(self.format_string(self.path_to_save))
+            self._checkpoint_store = CheckpointStore(
+                root_path / 'checkpoints' / self.name)
+            self._file_digests = {
+                'config': file_digest(self.path_to_config_file),
+                'program': file_digest(self.path_to_program_file)}
+        return self._checkpoint_store
+
+    def _point_key(self, parameters):
+        """Key identifying a point in the checkpoints.
+
+        A point is identified by the indices of the loops containing the
+        task, the evaluated parameters and the content of the config and
+        program files.
+
+        """
+        return CheckpointStore.point_key(loop_indices(self), parameters,
+                                         self._file_digests)
+
+    def _export(self, results_recarray, parameters):
+        """Append the streams of the point to the export files.
+
+        The files are written in a folder named after the save prefix and
+        the task in the save directory, and closed at the end of the
+        measurement. A point which cannot be exported makes the task fail.
+
+        """
+        root_path = Path(self.format_string(self.path_to_save))
+        save_prefix = self.format_string(self.save_prefix)
+        directory = str(root_path / f"{save_prefix}_{self.name}")
+        files = self.root.resources['files']
+        if directory not in files:
+            files[directory] = StreamExporter(directory, self.export_format)
+
+        metadata = {'meas_id': self.format_string('{meas_id}'),
+                    'point': self._exported_points}
+        metadata.update(loop_indices(self))
+        metadata.update({f'parameter_{k}': v for k, v in parameters.items()})
+        files[directory].write({name: results_recarray[name][0]
+                                for name in results_recarray.dtype.names},
+                               metadata)
+        self._exported_points += 1
+
+    def _restore_point(self, store, point_key):
+        """Write the checkpointed results of a point in the database.
+
+        """
+        queued_job = self._take_queued_job()
+        if queued_job is not None:
+            queued_job.close()
+
+        results_recarray, _ = store.load(point_key)
+        logger.info(f"Point {point_key} already acquired, using the "
+                    f"checkpointed results")
+        self._write_results(results_recarray)
+
+    def _write_results(self, results_recarray):
+        """Write the results and the previews of the streams in the database.
+
+        """
+        previews, results_recarray = preview_results(
+            results_recarray, parse_preview_streams(self.preview_streams),
+            self.preview_points, self.preview_method, self.preview_only)
+        for name, preview in previews.items():
+            self.write_in_database(f"preview_{name}", preview)
+
+        for name in results_recarray.dtype.names:
+            try:
+                self.write_in_database(f"variable_{name}",
+                                       results_recarray[name][0])
+            except:
+                logger.warning(f"Unexpected variable {name}")
+        self.write_in_database('Results', results_recarray)
+
+    def _write_telemetry(self):
+        """Write the fetch statistics and execution errors in the database.
+
+        """
+        self.write_in_database('Telemetry', self._collector.telemetry)
+        self.write_in_database('Sweep_telemetry',
+                               self._collector.sweep_telemetry())
+        self.write_in_database('Execution_errors', self._collector.errors)
+
+    def _evaluate_parameters(self, overrides=None):
+        """Evaluate all the parameters.
+
+        Overrides is a dictionary of database values used in place of
+        the current ones, to evaluate the parameters of another point.
+
+        """
+        evaluated_parameters = {}
+        for key, value in self.parameters.items():
+            if overrides is None:
+                evaluated_parameters[key] = self.format_and_eval_string(value)
+            else:
+                evaluated_parameters[key] = eval_with_overrides(self, value,
+                                                                overrides)
+        return evaluated_parameters
+
+    def _queue_next_point(self):
+        """Queue the program of the next point of the parent loop.
+
+        The program is only queued if the configuration of the next point
+        is identical to the current one, since the configuration of a
+        machine cannot change while jobs are queued, and if the task is the
+        only one executed by the loop (unless queue_with_other_tasks is
+        set) since other tasks could change the settings the queued program
+        relies on. The queued job is registered in the resources of the
+        root task so that it is cancelled if the measurement stops. Returns
+        whether a program was queued.
+
+        """
+        if not (self.queue_with_other_tasks or runs_alone_in_loop(self)):
+            return False
+
+        overrides = next_point_overrides(self)
+        if overrides is None:
+            return False
+
+        try:
+            parameters = self._evaluate_parameters(overrides)
+            config = self._config_module.get_config(parameters)
+            if config_digest(config) != self._config_digest:
+                return False
+            program = self._program_module.get_prog(parameters)
+        except Exception as e:
+            logger.debug(f"Couldn't build the program of the next point: {e}")
+            return False
+
+        pending_job = self.driver.queue_program(program,
+                                                machine=self.machine_name)
+        self._queued_job = QueuedJob(self.driver, config_digest(parameters),
+                                     pending_job)
+        self.root.resources['files'][self._queued_job_key()] = (
+            self._queued_job)
+        return True
+
+    def _take_queued_job(self):
+        """Get the job queued for this point, removing it from the resources.
+
+        """
+        queued_job = self._queued_job
+        self._queued_job = None
+        if queued_job is not None:
+            self.root.resources['files'].pop(self._queued_job_key(), None)
+        return queued_job
+
+    def _queued_job_key(self):
+        """Key of the queued job in the resources of the root task.
+
+        """
+        return f'queued_job_{self.name}'
+
+    def _prefetch_next_point(self):
+        """Start building the next point of the parent loop in a worker.
+
+        The prefetcher is stored in the resources of the root task so that
+        its worker is reused by all the passes of the outer loops and
+        stopped at the end of the measurement.
+
+        """
+        overrides = next_point_overrides(self)
+        if overrides is None:
+            return
+
+        try:
+            parameters = self._evaluate_parameters(overrides)
+        except Exception as e:
+            logger.debug(f"Couldn't evaluate the parameters of the next "
+                         f"point: {e}")
+            return
+
+        files = self.root.resources['files']
+        key = self._prefetcher_key()
+        if key not in files:
+            files[key] = PointPrefetcher(self.path_to_config_file,
+                                         self.path_to_program_file)
+        files[key].submit(config_digest(parameters), parameters)
+
+    def _prefetcher_key(self):
+        """Key of the point prefetcher in the resources of the root task.
+
+        """
+        return f'prefetcher_{self.name}'
+
+    def _get_streams(self, parameters):
+        """Description of the streams expected for the given parameters.
+
+        The streams declared by the get_streams function of the program
+        file, if any, override the ones found by the static analysis.
+
+        """
+        streams = dict(self._streams)
+        get_streams = getattr(self._program_module, 'get_streams', None)
+        if get_streams is not None:
+            try:
+                streams.update(parse_declared_streams(get_streams(parameters)))
+            except Exception as e:
+                logger.error(f"An exception occurred when trying to get the "
+                             f"streams from {self.path_to_program_file}")
+                logger.error(e)
+        return streams
+
     def _update_parameters(self):
         """Updates the parameters and attributes
 
+        """
+        parameters, comments = self._collect_parameters(
+            self._config_module, self._program_module)
+        self.comments = comments
+        self.parameters = parameters
+
+    def _collect_parameters(self, config_module, program_module):
+        """Gather the parameters defined by the config and program modules
+
+        Returns the parameters and comments dictionaries, the parameters
+        already entered by the user keeping their value.
+
         """
         params_config, params_program = {}, {}
         comments_config, comments_program = {}, {}
 
-        if self._config_module:
+        if config_module:
             try:
                 params_config, comments_config = self._parse_parameters(
-                    self._config_module.get_parameters())
+                    config_module.get_parameters())
             except AttributeError:
                 logger.error(f"{self.path_to_config_file} needs to "
                              f"have a get_parameters function "
@@ -273,10 +929,10 @@ class ConfigureExecuteTask(InstrumentTask):
                              f"parameters from {self.path_to_config_file}")
                 logger.error(e)
 
-        if self._program_module:
+        if program_module:
             try:
                 params_program, comments_program = self._parse_parameters(
-                    self._program_module.get_parameters())
+                    program_module.get_parameters())
             except AttributeError:
                 logger.error(f"{self.path_to_program_file} needs "
                              f"to have a get_parameters function")
@@ -286,10 +942,8 @@ class ConfigureExecuteTask(InstrumentTask):
                 logger.error(e)
 
         comments_config.update(comments_program)
-        self.comments = comments_config
-
         params_config.update(params_program)
-        self.parameters = params_config
+        return params_config, comments_config
 
     def _parse_parameters(self, params_in):
         """Parses the parameters dictionary entered in the file
@@ -318,98 +972,37 @@ class ConfigureExecuteTask(InstrumentTask):
         return tmp_parameters, tmp_comments
 
     def _find_variables(self):
-        """Attempts to find the variables saved in a QUA program
-
-        There are 2 types are variables: scalars and raw ADC data.
-        Scalars have to be explicitly saved with a call to the save
-        function whereas raw ADC data can be saved by using a string
-        instead of None as the third argument of the measure function.
-
-        New in v4: there are now streams that can be declared in the QUA
-        program and saved in a special stream_processing section of the
-        QUA program.
+        """Attempts to find the streams saved by the QUA program
 
-        The strategy employed here to find the name of the variables
-        is
+        The program file is analysed statically (see
+        exopy_qm.utils.stream_analysis). Stream names are resolved through
+        constants, f-strings and simple helper functions, and the shape
+        and dtype of each stream are inferred from the stream_processing
+        section when possible.
 
-        1) Find the get_results() function
+        Each stream gets a database entry named variable_<stream>
+        initialized with an array of the expected shape and dtype. When
+        every stream is fully described, the Results entry is declared
+        with its final structured dtype as well.
 
-        2) Find the name of the variable returned
-
-        3) Find a with statement that defines that variable (with the
-        program() context manager)
-
-        4) Find all instances of save(), save_all() and measure() inside
-        the with statement.
-
-        In the end, we are (almost) guaranteed to find a superset of
-        all variables that will be returned by the OPX.
+        Streams that cannot be found statically are still fetched and
+        stored in Results at runtime.
 
         """
-
-        saved_vars = set([])
-        get_results_fun, prog_name, program_node = None, None, None
-
-        # Make sure the program is somewhat valid before parsing it
-        try:
-            if self._program_module:
+        streams = {}
+        if self._program_module:
+            try:
                 with open(self.path_to_program_file) as f:
-                    try:
-                        root = ast.parse(f.read())
-                    except Exception as e:
-                        logger.error(f"An error occurred when parsing "
-                                     f"{self.path_to_program_file}")
-                        logger.error(e)
-                        raise ParseError
-
-                for i in ast.iter_child_nodes(root):
-                    if isinstance(i, ast.FunctionDef) and i.name == 'get_prog':
-                        get_results_fun = i
-                        break
-
-                if not get_results_fun:
-                    logger.error("Unable to find the get_prog function "
-                                 "in the program file")
-                    raise ParseError
-
-                for i in ast.iter_child_nodes(get_results_fun):
-                    if isinstance(i, ast.Return):
-                        prog_name = i.value.id
-                        break
-
-                if not prog_name:
-                    logger.error("Unable to find the name of the QUA program "
-                                 "in the get_prog function")
-                    raise ParseError
-
-                for i in ast.iter_child_nodes(get_results_fun):
-                    if (isinstance(i, ast.With) and i.items[0].optional_vars
-                            and i.items[0].optional_vars.id == prog_name):
-                        program_node = i
-                        break
-
-                if not program_node:
-                    logger.error("Unable to find the QUA program definition "
-                                 "in the get_prog function")
-                    raise ParseError
-
-                for i in ast.walk(program_node):
-                    if isinstance(i, ast.Call) and isinstance(
-                            i.func, ast.Name):
-                        if i.func.id == 'save' and isinstance(i.args[1], ast.Str):
-                            saved_vars.add(i.args[1].s)
-                        elif (i.func.id == 'measure'
-                              and isinstance(i.args[2], ast.Str)):
-                            saved_vars.add(i.args[2].s)
-                    elif isinstance(i, ast.Call) and isinstance(i.func, ast.Attribute) and i.func.attr in ['save', 'save_all']:
-                        try:
-                            saved_vars.add(i.args[0].s)
-                        except:
-                            raise ParseError("Variable name is not a string")
-
-        except ParseError:
-            logger.error("Unable to parse the program file to find "
-                         "the variable names")
+                    streams = find_streams(f.read(),
+                                           self.path_to_program_file)
+            except Exception as e:
+                logger.error(f"An error occurred when parsing "
+                             f"{self.path_to_program_file}")
+                logger.error(e)
+                logger.error("Unable to parse the program file to find "
+                             "the variable names")
+
+        self._streams = streams
 
         # Update the database
         de = self.database_entries.copy()
@@ -417,7 +1010,32 @@ class ConfigureExecuteTask(InstrumentTask):
             if k.startswith('variable'):
                 del de[k]
 
-        for i in saved_vars:
-            de['variable_' + i] = [0.0]
+        for name, info in streams.items():
+            de['variable_' + name] = _default_value(info)
+
+        de['Results'] = {}
+        if streams and all(i.is_static for i in streams.values()):
+            de['Results'] = np.zeros(1, dtype=[(n, i.dtype, i.shape)
+                                               for n, i in streams.items()])
 
         self.database_entries = de
+
+
+def _import_file(path):
+    """Import a python file as an anonymous module.
+
+    """
+    spec = importlib.util.spec_from_file_location("", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _default_value(info):
+    """Placeholder value of the database entry of a stream.
+
+    """
+    if info.shape is None:
+        return [0.0]
+    shape = tuple(1 if d is None else d for d in info.shape)
+    return np.zeros(shape, dtype=info.dtype or 'float64')
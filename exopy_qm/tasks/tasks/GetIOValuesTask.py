@@ -1,10 +1,13 @@
 from exopy.tasks.api import (InstrumentTask)
-from atom.api import Bool, set_default
+from atom.api import Str, Bool, set_default
 
 
 class GetIOValuesTask(InstrumentTask):
     """ Gets the IO values
     """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
     get_io_1 = Bool(True).tag(pref=True)
 
     get_io_2 = Bool(True).tag(pref=True)
@@ -15,7 +18,7 @@ class GetIOValuesTask(InstrumentTask):
         super().__init__(**kwargs)
 
     def perform(self):
-        io_values = self.driver.get_io_values()
+        io_values = self.driver.get_io_values(machine=self.machine_name)
         if self.get_io_1:
             self.write_in_database('IO1', io_values[0])
         if self.get_io_2:
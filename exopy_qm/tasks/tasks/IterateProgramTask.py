@@ -10,10 +10,13 @@ class IterateProgramTask(InstrumentTask):
     """Resume a QM program and iterate it using the 'iterate' input stream. Wait until it is paused again.
 
     """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
     def perform(self):
         # We assume that the program is paused and there is no data to get from the server
-        self.driver.iterate()
-        self.driver.wait_for_pause()
+        self.driver.iterate(machine=self.machine_name)
+        self.driver.wait_for_pause(machine=self.machine_name)
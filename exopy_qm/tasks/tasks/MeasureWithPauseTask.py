@@ -1,66 +1,213 @@
 import logging
+from pathlib import Path
 import numpy as np
 from inspect import cleandoc
 import time
+import uuid
 import qm.qua
-from atom.api import Float, Int, List, Typed, Str, Value, Bool, set_default
+from atom.api import (Float, Int, List, Typed, Str, Value, Bool, Enum,
+                      set_default)
 from exopy.tasks.api import InstrumentTask
 
+from exopy_qm.utils.checkpoint import CheckpointStore
+from exopy_qm.utils.decimation import parse_preview_streams, preview_results
+from exopy_qm.utils.results import (ResultCollector, WindowCollector,
+                                    memmap_results, TELEMETRY_DTYPE,
+                                    SWEEP_TELEMETRY_DTYPE)
+from exopy_qm.utils.shared_results import open_publisher
+from exopy_qm.utils.sweep import loop_indices
+
 logger = logging.getLogger(__name__)
 
 
 class MeasureWithPauseTask(InstrumentTask):
     """Resume a QM program which is paused, wait to is paused again and get the data from the OPX server.
 
+    In continuous mode, meant for programs running indefinitely and
+    saving their streams with save_all, only the samples acquired since
+    the previous iteration are fetched and the Results entry holds the
+    last window_size samples of each stream.
+
     """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
+    #: Folder where the results of each iteration are checkpointed (no
+    #: checkpoint if empty)
+    path_to_checkpoint = Str().tag(pref=True)
+
+    #: Name under which the streams are published in shared memory for
+    #: external analysis processes, the publication is disabled if empty
+    shared_memory_name = Str().tag(pref=True)
+
+    #: Number of iterations kept in the shared memory ring buffers
+    shared_memory_slots = Int(4).tag(pref=True)
+
+    #: Fetch only the new samples and keep the last window_size ones
+    continuous_mode = Bool(False).tag(pref=True)
+
+    #: Number of samples of each stream kept in continuous mode
+    window_size = Int(1000).tag(pref=True)
 
+    #: Comma separated names of the streams for which a decimated preview
+    #: is written in a preview_<stream> entry
+    preview_streams = Str().tag(pref=True)
 
-    database_entries = set_default({'Results': {}})
+    #: Number of bins of the previews
+    preview_points = Int(1000).tag(pref=True)
+
+    #: Reduction applied to each bin of the previews
+    preview_method = Enum('minmax', 'mean').tag(pref=True)
+
+    #: Leave the previewed streams out of the Results entry, their full
+    #: resolution data going only to the checkpoints and shared memory
+    preview_only = Bool(False).tag(pref=True)
+
+    #: Maximal size in MB of each fetch of the large streams saved with
+    #: save_all (0 to fetch each stream at once)
+    fetch_chunk_size = Int(0).tag(pref=True)
+
+    #: Folder in which the results are memory mapped instead of being
+    #: kept in memory (disabled if empty)
+    path_to_memmap = Str().tag(pref=True)
+
+    database_entries = set_default({
+        'Results': {},
+        'Telemetry': np.zeros(0, dtype=TELEMETRY_DTYPE),
+        'Sweep_telemetry': np.zeros(0, dtype=SWEEP_TELEMETRY_DTYPE),
+        'Execution_errors': []})
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._collector = ResultCollector()
+        self._checkpoint_store = None
 
 
     def check(self, *args, **kwargs):
         test, traceback = super(MeasureWithPauseTask,
                                 self).check(*args, **kwargs)
 
+        if self.continuous_mode and self.window_size < 1:
+            test = False
+            traceback[self.get_error_path() + '-window'] = (
+                'The window must contain at least one sample')
+
+        if (self.preview_streams and self.preview_only
+                and not self.path_to_checkpoint):
+            test = False
+            traceback[self.get_error_path() + '-preview'] = (
+                'Keeping only the previews requires checkpointing the full '
+                'resolution data')
+
         return test, traceback
 
     def perform(self):
         # We assume that the program is paused and there is no data to get from the server
-        self.driver.resume()
-        while not self.driver.is_paused():
+        self.driver.resume(machine=self.machine_name)
+        while not self.driver.is_paused(machine=self.machine_name):
             time.sleep(0.01)
         time.sleep(0.1) #to be adjusted to the time it takes to retrieve the data
 
-        # check if the data are None: it happens if the server hasn't finished averaging the data
-        while True:
-            results = self.driver.get_results()
-            one_is_none = False
-            for (name, handle) in results:
-                if handle.fetch_all() is None: # check is one entry of the data is None
-                    time.sleep(0.01)
-                    one_is_none = True
-            if not one_is_none: # wait for all entries to be not None before continuing
-                break
-
-
-
-        # Create the recarray to save the data
-        dt_array = []
-        for (name, handle) in results:
-            if name.endswith('_input1') or name.endswith('_input2'):
-                name = name[:-7]
-            data = handle.fetch_all(flat_struct=True)
-            dt_array += [(name, data.dtype, data.shape)]
-            if handle.has_dataloss():
-                logger.warning(f"{name} might have data loss")
-        results_recarray = np.zeros(1, dtype=dt_array)
-
-        # Save data in the recarray
-        for (name, handle) in results:
-            if name.endswith('_input1') or name.endswith('_input2'):
-                name = name[:-7]
-            data = handle.fetch_all(flat_struct=True)
-            results_recarray[name] = data
-        self.write_in_database('Results', results_recarray)
+        if self.continuous_mode:
+            # Only the new samples are fetched, the whole history is not
+            # downloaded to check that the data are ready.
+            results = self.driver.get_results(machine=self.machine_name)
+            if (not isinstance(self._collector, WindowCollector)
+                    or self._collector.window != self.window_size):
+                self._collector = WindowCollector(self.window_size)
+        else:
+            # check if the data are None: it happens if the server hasn't finished averaging the data
+            while True:
+                results = self.driver.get_results(machine=self.machine_name)
+                one_is_none = False
+                for (name, handle) in results:
+                    if handle.fetch_all() is None: # check is one entry of the data is None
+                        time.sleep(0.01)
+                        one_is_none = True
+                if not one_is_none: # wait for all entries to be not None before continuing
+                    break
+
+        # Save data in the buffer reused at each iteration
+        report = self.driver.get_execution_report(machine=self.machine_name)
+        self._collector.chunk_size = self.fetch_chunk_size * 2**20
+        self._collector.should_stop = self.root.should_stop
+        if self.path_to_memmap:
+            memmap_results(
+                self.root, self._collector,
+                Path(self.format_string(self.path_to_memmap)) / self.name)
+        if self.shared_memory_name:
+            self._collector.publisher = open_publisher(
+                self.root, self.format_string(self.shared_memory_name),
+                self.shared_memory_slots)
+        results_recarray = self._collector.collect(results, report)
+        previews, published = preview_results(
+            results_recarray, parse_preview_streams(self.preview_streams),
+            self.preview_points, self.preview_method, self.preview_only)
+        for name, preview in previews.items():
+            self.write_in_database(f"preview_{name}", preview)
+        self.write_in_database('Results', published)
+        self.write_in_database('Telemetry', self._collector.telemetry)
+        self.write_in_database('Sweep_telemetry',
+                               self._collector.sweep_telemetry())
+        self.write_in_database('Execution_errors', self._collector.errors)
+        if self.continuous_mode:
+            self.write_in_database('Acquired', dict(self._collector.acquired))
+
+        if self._collector.partial:
+            logger.warning(f"The iteration is not checkpointed since "
+                           f"{', '.join(self._collector.partial)} were only "
+                           f"partially fetched")
+        elif self.path_to_checkpoint:
+            self._checkpoint(results_recarray)
+
+    def _post_setattr_preview_streams(self, old, new):
+        de = self.database_entries.copy()
+        for k in self.database_entries:
+            if k.startswith('preview_'):
+                del de[k]
+        for name in parse_preview_streams(new):
+            de[f'preview_{name}'] = np.zeros(0)
+        self.database_entries = de
+
+    def _post_setattr_continuous_mode(self, old, new):
+        de = self.database_entries.copy()
+        if new:
+            de['Acquired'] = {}
+        else:
+            de.pop('Acquired', None)
+        self.database_entries = de
+
+    def _checkpoint(self, results_recarray):
+        """Save the results of the iteration in the checkpoint folder.
+
+        The program state lives on the OPX, so the iterations cannot be
+        skipped when restarting a measurement, but their results are kept:
+        the keys include an identifier drawn for each run, so that a run
+        using the same folder does not overwrite the previous ones.
+
+        """
+        if self._checkpoint_store is None:
+            path = Path(self.format_string(self.path_to_checkpoint))
+            self._checkpoint_store = CheckpointStore(path / self.name)
+            self._run_id = uuid.uuid4().hex
+        self._iteration += 1
+        indices = loop_indices(self)
+        key = CheckpointStore.point_key(self._run_id, indices,
+                                        self._iteration)
+        metadata = {'meas_id': self.format_string('{meas_id}'),
+                    'run': self._run_id, 'iteration': self._iteration,
+                    'indices': indices}
+        self._checkpoint_store.save(key, results_recarray, metadata)
+
+    #--------------------------Private API------------------------------#
+
+    #: Collector fetching the results into a reusable buffer
+    _collector = Value()
+
+    #: Store holding the checkpointed iterations
+    _checkpoint_store = Value()
+
+    #: Identifier of the run included in the keys of the checkpoints
+    _run_id = Str()
+
+    #: Number of iterations performed
+    _iteration = Int()
@@ -1,4 +1,5 @@
 import logging
+from pathlib import Path
 import numpy as np
 from inspect import cleandoc
 import time
@@ -6,6 +7,9 @@ import qm.qua
 from atom.api import Float, Int, List, Typed, Str, Value, Bool, set_default
 from exopy.tasks.api import InstrumentTask
 
+from exopy_qm.utils.results import (ResultCollector, memmap_results,
+                                    TELEMETRY_DTYPE)
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,11 +17,24 @@ class ResumeAndGetDataTask(InstrumentTask):
     """Resume a QM program and finishes it using the 'iterate' input stream.
 
     """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
+    #: Maximal size in MB of each fetch of the large streams saved with
+    #: save_all (0 to fetch each stream at once)
+    fetch_chunk_size = Int(0).tag(pref=True)
 
+    #: Folder in which the results are memory mapped instead of being
+    #: kept in memory (disabled if empty)
+    path_to_memmap = Str().tag(pref=True)
 
-    database_entries = set_default({'Results': {}})
+    database_entries = set_default({
+        'Results': {},
+        'Telemetry': np.zeros(0, dtype=TELEMETRY_DTYPE),
+        'Execution_errors': []})
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._collector = ResultCollector()
 
 
     def check(self, *args, **kwargs):
@@ -28,24 +45,24 @@ class ResumeAndGetDataTask(InstrumentTask):
 
     def perform(self):
         # We assume that the program is paused for the last time
-        self.driver.resume()
-
-        self.driver.wait_for_all_results()
-        results = self.driver.get_results()
-        report = self.driver.get_execution_report()
-        if report.has_errors():
-            for e in report.errors():
-                logger.warning(e)
-
-        dt_array = []
-        all_data = []
-        for (name, handle) in results:
-            if name.endswith('_input1') or name.endswith('_input2'):
-                name = name[:-7]
-            all_data.append(handle.fetch_all(flat_struct=True))
-            dt_array += [(name, all_data[-1].dtype, all_data[-1].shape)]
-            if handle.has_dataloss():
-                logger.warning(f"{name} might have data loss")
-
-        results_recarray = np.array([tuple(all_data)], dtype=dt_array)
-        self.write_in_database('Results', results_recarray)
\ No newline at end of file
+        self.driver.resume(machine=self.machine_name)
+
+        self.driver.wait_for_all_results(machine=self.machine_name)
+        results = self.driver.get_results(machine=self.machine_name)
+        report = self.driver.get_execution_report(machine=self.machine_name)
+
+        self._collector.chunk_size = self.fetch_chunk_size * 2**20
+        self._collector.should_stop = self.root.should_stop
+        if self.path_to_memmap:
+            memmap_results(
+                self.root, self._collector,
+                Path(self.format_string(self.path_to_memmap)) / self.name)
+        results_recarray = self._collector.collect(results, report)
+        self.write_in_database('Results', results_recarray)
+        self.write_in_database('Telemetry', self._collector.telemetry)
+        self.write_in_database('Execution_errors', self._collector.errors)
+
+    #--------------------------Private API------------------------------#
+
+    #: Collector fetching the results into a reusable buffer
+    _collector = Value()
\ No newline at end of file
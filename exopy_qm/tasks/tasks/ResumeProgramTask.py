@@ -1,12 +1,16 @@
 from exopy.tasks.api import (InstrumentTask)
+from atom.api import Str
 
 
 class ResumeProgramTask(InstrumentTask):
     """ Resumes a paused program.
     """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
     def perform(self):
-        self.driver.resume()
-        self.driver.wait_for_pause()
\ No newline at end of file
+        self.driver.resume(machine=self.machine_name)
+        self.driver.wait_for_pause(machine=self.machine_name)
\ No newline at end of file
@@ -0,0 +1,110 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+from atom.api import Str, Value, set_default
+from exopy.tasks.api import InstrumentTask
+
+logger = logging.getLogger(__name__)
+
+
+class SetFrequenciesTask(InstrumentTask):
+    """Set the IF of several elements along with their mixer correction.
+
+    The corrections are interpolated from a calibration table loaded on
+    the driver and only the values which changed since the previous point
+    are sent to the machine.
+
+    """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
+    #: Path to the calibration file of the mixers
+    path_to_calibration = Str().tag(pref=True)
+
+    #: Comma separated names of the elements
+    elements = Str().tag(pref=True)
+
+    #: IF of the elements in Hz, either one value per element or a single
+    #: value used for all of them
+    intermediate_frequencies = Str().tag(pref=True)
+
+    #: LO frequency in Hz used for all the elements (the one of the
+    #: configuration is used if empty)
+    lo_frequency = Str().tag(pref=True)
+
+    database_entries = set_default({'Updates': 0})
+
+    def check(self, *args, **kwargs):
+        test, traceback = super(SetFrequenciesTask,
+                                self).check(*args, **kwargs)
+
+        if self.path_to_calibration:
+            try:
+                path = Path(self.format_string(self.path_to_calibration))
+            except Exception:
+                path = None
+            if path is not None and not path.is_file():
+                test = False
+                traceback[self.get_error_path() + '-calibration'] = (
+                    f'Calibration file {path} not found')
+
+        evaluated = {}
+        for name in ('intermediate_frequencies', 'lo_frequency'):
+            value = getattr(self, name)
+            if not value:
+                continue
+            try:
+                evaluated[name] = self.format_and_eval_string(value)
+            except Exception as e:
+                test = False
+                traceback[self.get_error_path() + '-' + name] = (
+                    f"Couldn't evaluate {value} : {e}")
+
+        if 'intermediate_frequencies' in evaluated:
+            frequencies = evaluated['intermediate_frequencies']
+            elements = self._element_names()
+            try:
+                np.broadcast_to(frequencies, (len(elements),))
+            except ValueError:
+                test = False
+                traceback[self.get_error_path() + '-frequencies'] = (
+                    f"Expected a single IF or one IF per element "
+                    f"({len(elements)}), got {np.size(frequencies)}")
+
+        return test, traceback
+
+    def perform(self):
+        if self.path_to_calibration:
+            path = self.format_string(self.path_to_calibration)
+            if path != self._loaded_calibration:
+                self.driver.load_calibration(path)
+                self._loaded_calibration = path
+
+        elements = self._element_names()
+        frequencies = np.broadcast_to(
+            self.format_and_eval_string(self.intermediate_frequencies),
+            (len(elements),))
+        intermediate_frequencies = dict(zip(elements,
+                                            frequencies.tolist()))
+
+        lo_frequencies = None
+        if self.lo_frequency:
+            lo = float(self.format_and_eval_string(self.lo_frequency))
+            lo_frequencies = dict.fromkeys(elements, lo)
+
+        sent = self.driver.set_frequencies(intermediate_frequencies,
+                                           lo_frequencies,
+                                           machine=self.machine_name)
+        self.write_in_database('Updates', sent or 0)
+
+    #--------------------------Private API------------------------------#
+
+    #: Path of the calibration file loaded on the driver
+    _loaded_calibration = Value()
+
+    def _element_names(self):
+        """Names of the elements whose frequencies are set.
+
+        """
+        return [e.strip() for e in self.elements.split(',') if e.strip()]
@@ -7,6 +7,9 @@ from exopy_qm.utils.utils import is_int, is_float
 class SetIOValuesTask(InstrumentTask):
     """ Sets the IO values
     """
+    #: Name of the quantum machine used (empty for the default one)
+    machine_name = Str().tag(pref=True)
+
     set_io_1 = Bool(True).tag(pref=True)
     io_1_value = Str().tag(pref=True)
 
@@ -20,11 +23,14 @@ class SetIOValuesTask(InstrumentTask):
 
     def perform(self):
         if self.set_io_1 and self.io_2_value:
-            self.driver.set_io_values(self.__get_io1_value(), self.__get_io2_value())
+            self.driver.set_io_values(self.__get_io1_value(), self.__get_io2_value(),
+                                      machine=self.machine_name)
         elif self.set_io_1:
-            self.driver.set_io_values(self.__get_io1_value(), None)
+            self.driver.set_io_values(self.__get_io1_value(), None,
+                                      machine=self.machine_name)
         elif self.set_io_2:
-            self.driver.set_io_values(None, self.__get_io2_value())
+            self.driver.set_io_values(None, self.__get_io2_value(),
+                                      machine=self.machine_name)
 
     @staticmethod
     def __get_value(x):
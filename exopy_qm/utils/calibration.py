@@ -0,0 +1,137 @@
+"""Lookup table of the mixer corrections measured at several frequencies.
+
+"""
+import csv
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CalibrationTable(object):
+    """Mixer correction matrices indexed by (mixer, IF, LO).
+
+    For each mixer the measured points are grouped by LO frequency and
+    sorted by intermediate frequency. Corrections at other frequencies
+    are linearly interpolated along the IF and, if the LO frequency was
+    not measured, between the two closest LO frequencies. Frequencies
+    outside of the measured range use the closest measured point.
+
+    Parameters
+    ----------
+    mixers : array-like
+        Name of the mixer of each point.
+
+    intermediate_frequencies : array-like
+        IF of each point in Hz.
+
+    lo_frequencies : array-like
+        LO frequency of each point in Hz.
+
+    corrections : array-like
+        Correction matrix of each point, either as (n, 4) or (n, 2, 2).
+
+    """
+
+    def __init__(self, mixers, intermediate_frequencies, lo_frequencies,
+                 corrections):
+        mixers = np.asarray(mixers, dtype=str)
+        ifs = np.asarray(intermediate_frequencies, dtype=float)
+        los = np.asarray(lo_frequencies, dtype=float)
+        corrections = np.asarray(corrections, dtype=float).reshape(-1, 4)
+        if not len(mixers) == len(ifs) == len(los) == len(corrections):
+            raise ValueError('All the columns of the calibration table must '
+                             'have the same length')
+
+        #: Per mixer, sorted LO frequencies and for each of them the sorted
+        #: IFs and the corresponding corrections.
+        self._mixers = {}
+        for mixer in np.unique(mixers):
+            selected = mixers == mixer
+            m_ifs, m_los = ifs[selected], los[selected]
+            m_corrections = corrections[selected]
+            order = np.lexsort((m_ifs, m_los))
+            m_ifs, m_los = m_ifs[order], m_los[order]
+            m_corrections = m_corrections[order]
+            lo_values, starts = np.unique(m_los, return_index=True)
+            bounds = list(starts[1:]) + [len(m_los)]
+            self._mixers[str(mixer)] = (
+                lo_values,
+                [(m_ifs[s:e], m_corrections[s:e])
+                 for s, e in zip(starts, bounds)])
+
+    @classmethod
+    def load(cls, path):
+        """Load a calibration file.
+
+        Supported formats are .npz files containing the arrays mixer,
+        intermediate_frequency, lo_frequency and correction, and .csv
+        files with the columns mixer, intermediate_frequency,
+        lo_frequency, c00, c01, c10 and c11.
+
+        """
+        path = Path(path)
+        if path.suffix == '.npz':
+            with np.load(path) as data:
+                return cls(data['mixer'], data['intermediate_frequency'],
+                           data['lo_frequency'], data['correction'])
+        elif path.suffix == '.csv':
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+            return cls([r['mixer'] for r in rows],
+                       [r['intermediate_frequency'] for r in rows],
+                       [r['lo_frequency'] for r in rows],
+                       [[r['c00'], r['c01'], r['c10'], r['c11']]
+                        for r in rows])
+        raise ValueError(f'Unsupported calibration file {path}')
+
+    @property
+    def mixers(self):
+        """Names of the calibrated mixers.
+
+        """
+        return list(self._mixers)
+
+    def corrections(self, mixer, intermediate_frequencies, lo_frequency):
+        """Correction matrices of a mixer for several IFs at a given LO.
+
+        Returns
+        -------
+        corrections : np.ndarray
+            (n, 4) array of the flattened correction matrices.
+
+        """
+        if mixer not in self._mixers:
+            raise KeyError(f'Mixer {mixer} is not calibrated')
+        ifs = np.atleast_1d(np.asarray(intermediate_frequencies, dtype=float))
+        lo_values, groups = self._mixers[mixer]
+
+        index = np.searchsorted(lo_values, lo_frequency)
+        if index < len(lo_values) and lo_values[index] == lo_frequency:
+            return self._interp_if(groups[index], ifs)
+        if index == 0:
+            return self._interp_if(groups[0], ifs)
+        if index == len(lo_values):
+            return self._interp_if(groups[-1], ifs)
+
+        lower = self._interp_if(groups[index - 1], ifs)
+        upper = self._interp_if(groups[index], ifs)
+        weight = ((lo_frequency - lo_values[index - 1])
+                  / (lo_values[index] - lo_values[index - 1]))
+        return lower + (upper - lower) * weight
+
+    def correction(self, mixer, intermediate_frequency, lo_frequency):
+        """Correction matrix of a mixer as a tuple of 4 floats.
+
+        """
+        values = self.corrections(mixer, intermediate_frequency,
+                                  lo_frequency)[0]
+        return tuple(float(v) for v in values)
+
+    @staticmethod
+    def _interp_if(group, ifs):
+        group_ifs, corrections = group
+        return np.stack([np.interp(ifs, group_ifs, corrections[:, i])
+                         for i in range(4)], axis=-1)
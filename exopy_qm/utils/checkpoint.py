@@ -0,0 +1,89 @@
+"""On-disk checkpoints of the results of completed sweep points.
+
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .config_tools import config_digest
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path):
+    """Digest of the content of a file.
+
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class CheckpointStore(object):
+    """Directory holding the results of the completed points of a sweep.
+
+    Each point is identified by a key (see point_key) and stored in its
+    own .npz file, written atomically so that a crash never leaves a
+    partially written point. An index.jsonl file lists the metadata of
+    the points in the order they were completed.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def point_key(*parts):
+        """Build the key of a point from the values identifying it.
+
+        """
+        return config_digest(parts)
+
+    def __contains__(self, key):
+        return self._path(key).exists()
+
+    def save(self, key, results, metadata):
+        """Save the results of a point.
+
+        Parameters
+        ----------
+        key : str
+            Key of the point.
+
+        results : np.ndarray
+            Structured array containing the results of the point.
+
+        metadata : dict
+            JSON serializable description of the point (non serializable
+            values are stored using their repr).
+
+        """
+        metadata = dict(metadata, key=key, time=time.time())
+        serialized = json.dumps(metadata, default=repr)
+
+        path = self._path(key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, results=results, metadata=np.array(serialized))
+        os.replace(tmp_path, path)
+
+        with open(self.directory / 'index.jsonl', 'a') as f:
+            f.write(serialized + '\n')
+
+    def load(self, key):
+        """Load the results and metadata of a point.
+
+        """
+        with np.load(self._path(key), allow_pickle=False) as data:
+            return data['results'], json.loads(str(data['metadata']))
+
+    def _path(self, key):
+        return self.directory / f'{key}.npz'
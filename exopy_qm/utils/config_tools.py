@@ -0,0 +1,282 @@
+"""Tools to manipulate QM configurations.
+
+"""
+import hashlib
+
+import numpy as np
+
+
+def _feed(h, obj):
+    if isinstance(obj, dict):
+        h.update(b'd')
+        for key in sorted(obj, key=str):
+            _feed(h, key)
+            _feed(h, obj[key])
+        h.update(b'e')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'l')
+        for item in obj:
+            _feed(h, item)
+        h.update(b'e')
+    elif isinstance(obj, np.ndarray):
+        h.update(b'a' + obj.dtype.str.encode() + str(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(type(obj).__name__.encode() + repr(obj).encode())
+
+
+def config_digest(obj):
+    """Stable digest of a configuration (or any nested python structure).
+
+    Two structures with the same content, including numpy arrays, have the
+    same digest regardless of dictionary ordering.
+
+    """
+    h = hashlib.sha1()
+    _feed(h, obj)
+    return h.hexdigest()
+
+
+def _waveform_key(waveform):
+    """Key identifying waveforms with the same content.
+
+    Returns None for waveforms that should be left untouched.
+
+    """
+    extra = tuple(sorted((k, repr(v)) for k, v in waveform.items()
+                         if k not in ('type', 'samples', 'sample')))
+    if waveform.get('type') == 'constant':
+        return ('constant', float(waveform['sample'])) + extra
+    if waveform.get('type') == 'arbitrary':
+        if waveform.get('is_overridable', False):
+            return None
+        samples = np.asarray(waveform['samples'], dtype=float)
+        return ('arbitrary', samples.tobytes()) + extra
+    return None
+
+
+def compact_config(config):
+    """Merge duplicated waveforms of a configuration.
+
+    Arbitrary waveforms whose samples are all equal are turned into
+    constant waveforms, then waveforms with identical content are merged
+    and the pulses updated to reference the remaining one. Overridable
+    waveforms are never modified. Waveforms which are scaled copies of
+    each other cannot be merged without changing the program and are
+    only counted.
+
+    The configuration passed is not modified.
+
+    Returns
+    -------
+    config : dict
+        The compacted configuration.
+
+    stats : dict
+        Number of waveforms before and after, of waveforms turned into
+        constants, of scaled copies found and an estimate of the number
+        of bytes saved (8 bytes per sample).
+
+    """
+    waveforms = config.get('waveforms', {})
+    stats = {'waveforms': len(waveforms), 'constants': 0, 'merged': 0,
+             'scaled_copies': 0, 'bytes_saved': 0}
+
+    compacted = {}
+    renames = {}
+    canonical = {}
+    shapes = set()
+    for name, waveform in waveforms.items():
+        samples = None
+        if waveform.get('type') == 'arbitrary' and not waveform.get(
+                'is_overridable', False):
+            samples = np.asarray(waveform['samples'], dtype=float)
+            if samples.size and np.all(samples == samples[0]):
+                stats['bytes_saved'] += samples.nbytes - 8
+                stats['constants'] += 1
+                waveform = {k: v for k, v in waveform.items()
+                            if k not in ('type', 'samples', 'sampling_rate',
+                                         'max_allowed_error')}
+                waveform.update(type='constant', sample=float(samples[0]))
+                samples = None
+
+        key = _waveform_key(waveform)
+        if key is not None and key in canonical:
+            renames[name] = canonical[key]
+            stats['merged'] += 1
+            stats['bytes_saved'] += 8 if samples is None else samples.nbytes
+            continue
+        if key is not None:
+            canonical[key] = name
+        compacted[name] = waveform
+
+        if samples is not None and samples.size:
+            scale = np.abs(samples).max()
+            if scale:
+                shape = (samples / scale).round(12).tobytes()
+                if shape in shapes:
+                    stats['scaled_copies'] += 1
+                shapes.add(shape)
+
+    new_config = dict(config)
+    new_config['waveforms'] = compacted
+    stats['compacted_waveforms'] = len(compacted)
+
+    if renames and 'pulses' in config:
+        pulses = {}
+        for name, pulse in config['pulses'].items():
+            refs = pulse.get('waveforms', {})
+            if any(w in renames for w in refs.values()):
+                pulse = dict(pulse)
+                pulse['waveforms'] = {k: renames.get(w, w)
+                                      for k, w in refs.items()}
+            pulses[name] = pulse
+        new_config['pulses'] = pulses
+
+    return new_config, stats
+
+
+#: Ports declared by a controller for each kind of connection.
+_PORT_KINDS = {'analog_outputs': 'analog output',
+               'analog_inputs': 'analog input',
+               'digital_outputs': 'digital output'}
+
+
+def _check_port(errors, controllers, where, port, kind):
+    """Check that a (controller, port) reference is declared.
+
+    """
+    try:
+        con, number = port
+    except (TypeError, ValueError):
+        errors.append(f"{where}: invalid port {port!r}, expected a "
+                      f"(controller, port) tuple")
+        return
+    if con not in controllers:
+        errors.append(f"{where}: unknown controller {con}")
+    elif number not in controllers[con].get(kind, {}):
+        errors.append(f"{where}: {_PORT_KINDS[kind]} {number} of {con} is "
+                      f"not declared")
+
+
+def validate_config(config):
+    """Check the consistency of a configuration without a server.
+
+    The references between controllers, elements, pulses and waveforms
+    are checked, along with the ports used by the elements, the length of
+    the pulses and of their arbitrary waveforms and the range of the
+    waveform samples.
+
+    Returns
+    -------
+    errors : list
+        Description of the problems found, empty if the configuration is
+        valid.
+
+    """
+    if not isinstance(config, dict):
+        return [f"The configuration is a {type(config).__name__}, not a "
+                f"dictionary"]
+
+    errors = []
+    for key in ('controllers', 'elements', 'pulses', 'waveforms'):
+        if key not in config:
+            errors.append(f"Missing section {key}")
+    controllers = config.get('controllers', {})
+    elements = config.get('elements', {})
+    pulses = config.get('pulses', {})
+    waveforms = config.get('waveforms', {})
+    digital_waveforms = config.get('digital_waveforms', {})
+    weights = config.get('integration_weights', {})
+    mixers = config.get('mixers', {})
+
+    for name, waveform in waveforms.items():
+        kind = waveform.get('type')
+        if kind == 'constant':
+            samples = np.atleast_1d(waveform.get('sample', np.nan))
+        elif kind == 'arbitrary':
+            samples = np.asarray(waveform.get('samples', ()), dtype=float)
+            if not samples.size:
+                errors.append(f"Waveform {name} has no samples")
+        else:
+            errors.append(f"Waveform {name} has an invalid type {kind!r}")
+            continue
+        if samples.size and not np.all((samples >= -0.5) & (samples < 0.5)):
+            errors.append(f"Waveform {name} has samples outside of "
+                          f"[-0.5, 0.5)")
+
+    for name, pulse in pulses.items():
+        where = f"Pulse {name}"
+        if pulse.get('operation') not in ('control', 'measurement'):
+            errors.append(f"{where} has an invalid operation "
+                          f"{pulse.get('operation')!r}")
+        length = pulse.get('length')
+        if not isinstance(length, (int, np.integer)) or length < 16 \
+                or length % 4:
+            errors.append(f"{where} has an invalid length {length!r}, it "
+                          f"must be a multiple of 4 of at least 16 ns")
+            length = None
+        for port, waveform in pulse.get('waveforms', {}).items():
+            if waveform not in waveforms:
+                errors.append(f"{where} uses the unknown waveform "
+                              f"{waveform}")
+                continue
+            wf = waveforms[waveform]
+            if (length is not None and wf.get('type') == 'arbitrary'
+                    and not wf.get('sampling_rate')
+                    and len(wf.get('samples', ())) != length):
+                errors.append(f"{where} lasts {length} ns but its {port} "
+                              f"waveform {waveform} has "
+                              f"{len(wf.get('samples', ()))} samples")
+        marker = pulse.get('digital_marker')
+        if marker is not None and marker not in digital_waveforms:
+            errors.append(f"{where} uses the unknown digital waveform "
+                          f"{marker}")
+        for weight in pulse.get('integration_weights', {}).values():
+            if weight not in weights:
+                errors.append(f"{where} uses the unknown integration "
+                              f"weights {weight}")
+        if pulse.get('operation') == 'control' and \
+                pulse.get('integration_weights'):
+            errors.append(f"{where} is a control pulse with integration "
+                          f"weights")
+
+    for name, element in elements.items():
+        where = f"Element {name}"
+        inputs = None
+        if 'singleInput' in element:
+            inputs = {'single'}
+            _check_port(errors, controllers, where,
+                        element['singleInput'].get('port'), 'analog_outputs')
+        elif 'mixInputs' in element:
+            inputs = {'I', 'Q'}
+            mix_inputs = element['mixInputs']
+            for port in ('I', 'Q'):
+                _check_port(errors, controllers, where, mix_inputs.get(port),
+                            'analog_outputs')
+            mixer = mix_inputs.get('mixer')
+            if mixer is not None and mixer not in mixers:
+                errors.append(f"{where} uses the unknown mixer {mixer}")
+        for output in element.get('outputs', {}).values():
+            _check_port(errors, controllers, where, output, 'analog_inputs')
+        for digital in element.get('digitalInputs', {}).values():
+            _check_port(errors, controllers, where, digital.get('port'),
+                        'digital_outputs')
+
+        for operation, pulse in element.get('operations', {}).items():
+            if pulse not in pulses:
+                errors.append(f"{where}: operation {operation} uses the "
+                              f"unknown pulse {pulse}")
+                continue
+            used = set(pulses[pulse].get('waveforms', {}))
+            if inputs is not None and used != inputs:
+                errors.append(f"{where}: operation {operation} plays the "
+                              f"{', '.join(sorted(used)) or 'no'} waveforms "
+                              f"but the element has the "
+                              f"{', '.join(sorted(inputs))} inputs")
+            if pulses[pulse].get('operation') == 'measurement' and \
+                    not element.get('outputs'):
+                errors.append(f"{where}: operation {operation} is a "
+                              f"measurement but the element has no output")
+
+    return errors
@@ -0,0 +1,105 @@
+"""Decimation of long streams into lightweight previews for live display.
+
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Supported decimation methods.
+PREVIEW_METHODS = ('minmax', 'mean')
+
+
+def decimate(data, points, method='minmax'):
+    """Reduce the last axis of an array to a given number of bins.
+
+    The last axis is split in points bins of (almost) equal size which
+    are reduced at once using ufunc.reduceat.
+
+    Parameters
+    ----------
+    data : array-like
+        Data to decimate, the last axis usually being the time.
+
+    points : int
+        Number of bins.
+
+    method : {'minmax', 'mean'}
+        With 'minmax' each bin gives its minimum followed by its maximum,
+        which preserves the envelope of the signal (2 * points values).
+        With 'mean' each bin gives its average.
+
+    Returns
+    -------
+    preview : np.ndarray
+        Decimated copy of the data, or a copy of the data if it is
+        already small enough.
+
+    """
+    data = np.asarray(data)
+    if method not in PREVIEW_METHODS:
+        raise ValueError(f'Unsupported decimation method {method}')
+    size = data.shape[-1] if data.ndim else 0
+    limit = 2 * points if method == 'minmax' else points
+    if points < 1 or size <= limit:
+        return data.copy()
+
+    edges = np.linspace(0, size, points + 1).astype(np.intp)[:-1]
+    if method == 'mean':
+        counts = np.diff(np.append(edges, size))
+        return np.add.reduceat(data, edges, axis=-1, dtype=float) / counts
+
+    preview = np.empty(data.shape[:-1] + (2 * points,), dtype=data.dtype)
+    preview[..., 0::2] = np.minimum.reduceat(data, edges, axis=-1)
+    preview[..., 1::2] = np.maximum.reduceat(data, edges, axis=-1)
+    return preview
+
+
+def parse_preview_streams(streams):
+    """Names of the streams to preview from a comma separated string.
+
+    """
+    return [s.strip() for s in streams.split(',') if s.strip()]
+
+
+def preview_results(results, streams, points, method='minmax',
+                    exclude=False):
+    """Decimated previews of some streams of a result buffer.
+
+    Parameters
+    ----------
+    results : np.ndarray
+        One element structured array holding one field per stream.
+
+    streams : list
+        Names of the streams to preview.
+
+    points, method :
+        Decimation parameters, see decimate.
+
+    exclude : bool
+        Remove the previewed streams from the returned results.
+
+    Returns
+    -------
+    previews : dict
+        Mapping between stream names and their preview.
+
+    results : np.ndarray
+        The results, as a view without the previewed fields if exclude is
+        True (multi-field indexing does not copy the data).
+
+    """
+    names = results.dtype.names
+    previews = {}
+    for name in streams:
+        if name not in names:
+            logger.warning(f"Stream {name} not found, no preview is "
+                           f"generated")
+            continue
+        previews[name] = decimate(results[name][0], points, method)
+
+    if exclude and previews:
+        results = results[[n for n in names if n not in previews]]
+    return previews, results
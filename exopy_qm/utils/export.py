@@ -0,0 +1,155 @@
+"""Columnar export of the fetched streams using Apache Arrow.
+
+pyarrow is an optional dependency, only required when the export is
+enabled (pip install exopy_qm[arrow]).
+
+"""
+import logging
+import weakref
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+#: Supported export formats and the extension of the files.
+EXPORT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrows'}
+
+
+def _values_array(data):
+    """Flat Arrow array sharing the memory of a numpy array when possible.
+
+    Non contiguous and byte swapped data are copied.
+
+    """
+    flat = data.reshape(-1) if data.flags.c_contiguous else data.ravel()
+    if not flat.dtype.isnative:
+        flat = flat.astype(flat.dtype.newbyteorder('='))
+    if flat.dtype.kind in 'iuf':
+        return pa.Array.from_buffers(pa.from_numpy_dtype(flat.dtype),
+                                     flat.size, [None, pa.py_buffer(flat)])
+    return pa.array(flat)
+
+
+def _metadata_array(value):
+    """One element array holding a metadata value.
+
+    All the numbers are stored as float64 and everything else as strings
+    so that the schema does not depend on the type a parameter happens to
+    evaluate to at a given point (1 then 1.5 for example).
+
+    """
+    if isinstance(value, (bool, int, float, np.bool_, np.number)):
+        try:
+            return pa.array([float(value)], pa.float64())
+        except TypeError:
+            # Complex numbers cannot be stored as floats.
+            pass
+    if not isinstance(value, str):
+        value = repr(value)
+    return pa.array([value], pa.string())
+
+
+class StreamExporter(object):
+    """Append the streams of each point to one file per stream.
+
+    Each point becomes one row holding the point metadata (one column per
+    entry, numbers being stored as float64 and other values as strings),
+    the shape of the data and the flattened data as a list column. The
+    numeric data are wrapped without a copy when they are contiguous and
+    each row is written as soon as it is built, so the source buffers can
+    be reused as soon as write returns.
+
+    With the 'arrow' format the files use the Arrow IPC streaming format
+    which stays readable even if the measurement is interrupted, Parquet
+    files are only complete once the exporter is closed.
+
+    Points which cannot be stored with the schema of the first point of a
+    stream raise a ValueError.
+
+    """
+
+    def __init__(self, directory, format='parquet'):
+        if pa is None:
+            raise ImportError('pyarrow is required to export the results, '
+                              'install it using pip install pyarrow')
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f'Unsupported export format {format}')
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self._writers = {}
+        self._schemas = {}
+        self._finalizer = weakref.finalize(self, _close_writers,
+                                           self._writers)
+
+    def write(self, streams, metadata):
+        """Append one point to the files of the streams.
+
+        Parameters
+        ----------
+        streams : dict
+            Mapping between stream names and numpy arrays.
+
+        metadata : dict
+            Values describing the point (measurement id, parameters...).
+
+        """
+        names = list(metadata)
+        columns = [_metadata_array(metadata[n]) for n in names]
+        for name, data in streams.items():
+            data = np.asarray(data)
+            values = _values_array(data)
+            offsets = pa.array([0, len(values)], pa.int32())
+            batch = pa.RecordBatch.from_arrays(
+                columns + [pa.array([list(data.shape)], pa.list_(pa.int64())),
+                           pa.ListArray.from_arrays(offsets, values)],
+                names + ['shape', 'data'])
+
+            table = pa.Table.from_batches([batch])
+            if name not in self._writers:
+                self._open(name, table.schema)
+            elif not table.schema.equals(self._schemas[name]):
+                try:
+                    table = table.cast(self._schemas[name])
+                except Exception as e:
+                    raise ValueError(
+                        f"The layout of the stream {name} changed and "
+                        f"cannot be converted to the one of the first "
+                        f"point:\n{table.schema}\ninstead of\n"
+                        f"{self._schemas[name]}") from e
+
+            # Written right away since the values may share the memory of
+            # a buffer reused for the next point.
+            self._writers[name].write_table(table)
+
+    def close(self):
+        """Close all the files, completing them.
+
+        """
+        self._finalizer()
+
+    def _open(self, name, schema):
+        path = self.directory / (name + EXPORT_FORMATS[self.format])
+        if self.format == 'parquet':
+            writer = pq.ParquetWriter(str(path), schema)
+        else:
+            writer = pa.ipc.new_stream(str(path), schema)
+        self._writers[name] = writer
+        self._schemas[name] = schema
+        return writer
+
+
+def _close_writers(writers):
+    for name, writer in writers.items():
+        try:
+            writer.close()
+        except Exception as e:
+            logger.error(f"Failed to close the export file of {name}: {e}")
+    writers.clear()
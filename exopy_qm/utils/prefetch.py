@@ -0,0 +1,116 @@
+"""Background construction of configurations and programs.
+
+"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+#: Modules imported by the worker process, by path.
+_modules = {}
+
+
+def _import_file(path):
+    """Import a python file, reusing the module while it is not modified.
+
+    """
+    mtime = os.path.getmtime(path)
+    cached = _modules.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    spec = importlib.util.spec_from_file_location("", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _modules[path] = (mtime, module)
+    return module
+
+
+def build_point(config_path, program_path, parameters):
+    """Build the configuration and the program for a set of parameters.
+
+    This function is executed in the worker process.
+
+    """
+    config = _import_file(config_path).get_config(parameters)
+    program = _import_file(program_path).get_prog(parameters)
+    return config, program
+
+
+class PointPrefetcher(object):
+    """Build the configuration and program of a point in a worker process.
+
+    Only one point is prefetched at a time. The worker process is started
+    on the first submission and stopped by close or when the prefetcher
+    is garbage collected. It is spawned rather than forked since forking
+    the multithreaded measurement process can deadlock the worker.
+
+    """
+
+    def __init__(self, config_path, program_path):
+        self.config_path = config_path
+        self.program_path = program_path
+        self._executor = None
+        self._pending = None
+        self._finalizer = None
+
+    def submit(self, key, parameters):
+        """Start building the point identified by key.
+
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            self._finalizer = weakref.finalize(self, self._executor.shutdown,
+                                               wait=False)
+        if self._pending is not None:
+            self._pending[1].cancel()
+        try:
+            future = self._executor.submit(build_point, self.config_path,
+                                           self.program_path, parameters)
+        except BrokenProcessPool as e:
+            # The worker died, a new one is started on the next submission.
+            logger.warning(f"Prefetching worker stopped unexpectedly: {e}")
+            self.close()
+            return
+        self._pending = (key, future)
+
+    def take(self, key):
+        """Get the configuration and program built for key.
+
+        Wait for the worker if the point is still being built.
+
+        Returns
+        -------
+        point : tuple or None
+            The (config, program) tuple or None if the point was not
+            prefetched or could not be built.
+
+        """
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return None
+        if pending[0] != key:
+            pending[1].cancel()
+            return None
+        try:
+            return pending[1].result()
+        except Exception as e:
+            logger.warning(f"Prefetching of the next point failed, it is "
+                           f"built on the measurement thread instead: {e}")
+            return None
+
+    def close(self):
+        """Stop the worker process.
+
+        """
+        self._pending = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self._executor = None
+        self._finalizer = None
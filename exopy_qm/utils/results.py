@@ -0,0 +1,447 @@
+"""Collection of the results of a QM job into reusable buffers.
+
+"""
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .stream_analysis import StreamInfo
+
+logger = logging.getLogger(__name__)
+
+#: Dtype of the per stream telemetry of a job.
+TELEMETRY_DTYPE = np.dtype([('stream', 'U64'), ('samples', 'i8'),
+                            ('bytes', 'i8'), ('fetch_time', 'f8'),
+                            ('dataloss', '?')])
+
+#: Dtype of the per stream telemetry aggregated over all the jobs.
+SWEEP_TELEMETRY_DTYPE = np.dtype([('stream', 'U64'), ('points', 'i8'),
+                                  ('samples', 'i8'), ('bytes', 'i8'),
+                                  ('fetch_time', 'f8'),
+                                  ('dataloss_points', 'i8'),
+                                  ('throughput', 'f8')])
+
+
+def parse_declared_streams(declared):
+    """Convert the output of a get_streams function into StreamInfo.
+
+    The program file can declare the streams it saves by defining a
+    get_streams(parameters) function returning a dictionary mapping each
+    stream name to a (shape, dtype) tuple, shape being a tuple of ints
+    or an int.
+
+    """
+    streams = {}
+    for name, (shape, dtype) in declared.items():
+        if isinstance(shape, int):
+            shape = (shape,)
+        streams[name] = StreamInfo(name, tuple(int(d) for d in shape),
+                                   np.dtype(dtype).str, 'declared')
+    return streams
+
+
+def memmap_results(root, collector, directory):
+    """Memory map the buffer of a collector in a directory.
+
+    The collector is stored in the resources of the root task so that its
+    files are deleted (see ResultCollector.close) at the end of the
+    measurement.
+
+    """
+    if collector.directory is None:
+        collector.directory = Path(directory)
+        root.resources['files'][f'results_{id(collector)}'] = collector
+
+
+class ResultCollector(object):
+    """Fetch the results of a job into a single structured buffer.
+
+    The buffer is a one element structured array with one field per
+    result handle, named after the handle (raw ADC data saved with
+    measure(..., 'name') hence give the name_input1 and name_input2
+    fields). It is allocated once, either from the streams descriptions
+    given to prepare or from the first fetched results, and filled in
+    place for all the following jobs as long as the layout of the
+    results does not change. Values read from the buffer are hence only
+    valid until the next call to collect.
+
+    The collector also records, for each stream, the number of samples
+    and bytes received, the time spent fetching them and whether data
+    were lost, along with the errors of the execution report. Those
+    statistics are available for the last job (telemetry, errors) and
+    aggregated over all the jobs collected (sweep_telemetry).
+
+    If a publisher (see exopy_qm.utils.shared_results) is set, the
+    streams of each job are also published in shared memory once
+    collected.
+
+    Streams holding all the values saved whose size exceeds chunk_size
+    bytes are fetched by slices written directly into the buffer, so that
+    no transient copy larger than a chunk is made. Those streams are found
+    from the descriptions given to prepare (see StreamInfo.accumulates)
+    or, for the streams which are not described, from their handle
+    providing count_so_far (streams saved with save only keep their last
+    value and do not). Fetching by chunks is interrupted as soon as the
+    should_stop event is set, leaving the remaining samples to zero and
+    listing the stream in the partial attribute.
+
+    The buffer can be a memory mapped .npy file to hold results larger
+    than the memory. Each allocation creates a new file with a unique name
+    in the directory, and the files are deleted by close. Since the buffer
+    is reused, the file only holds the results of the last job.
+
+    Parameters
+    ----------
+    chunk_size : int
+        Maximal size in bytes of each fetch, 0 to fetch each stream at
+        once.
+
+    directory : str or Path, optional
+        Directory in which the buffer is memory mapped, the buffer is
+        kept in memory if None.
+
+    should_stop : threading.Event, optional
+        Event interrupting the fetching by chunks.
+
+    """
+
+    def __init__(self, chunk_size=0, directory=None, should_stop=None):
+        self.buffer = None
+        self.publisher = None
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self.should_stop = should_stop
+        self.allocations = 0
+        self.telemetry = np.zeros(0, dtype=TELEMETRY_DTYPE)
+        self.errors = []
+        self.error_count = 0
+        #: Names of the streams whose fetching was interrupted in the last
+        #: job.
+        self.partial = []
+        self._sweep = {}
+        self._streams = {}
+        self._files = []
+
+    def prepare(self, streams):
+        """Allocate the buffer from the description of the streams.
+
+        The descriptions are also used to find the streams which can be
+        fetched by chunks. The buffer is not allocated if one of the
+        streams is not fully described or if the current buffer already
+        has the right layout.
+
+        Parameters
+        ----------
+        streams : dict
+            Mapping between stream names and StreamInfo.
+
+        """
+        self._streams = streams
+        if not streams or not all(i.is_static for i in streams.values()):
+            return
+        fields = [(name, np.dtype(i.dtype), i.shape)
+                  for name, i in streams.items()]
+        if not self._matches(fields):
+            self._allocate(fields)
+
+    def collect(self, results, report=None):
+        """Fetch all the handles and store the data in the buffer.
+
+        Parameters
+        ----------
+        results :
+            Result handles of the job.
+
+        report : optional
+            Execution report of the job, whose errors are logged and
+            recorded.
+
+        Returns
+        -------
+        buffer : np.ndarray
+            One element structured array containing the results.
+
+        """
+        # Fetch the small streams and find the layout of the large ones.
+        fetched = []
+        for name, handle in results:
+            start = time.perf_counter()
+            data, count = self._fetch_start(name, handle)
+            fetched.append((name, handle, data, count,
+                            time.perf_counter() - start))
+
+        fields = [(name, data.dtype,
+                   data.shape if count is None else (count,) + data.shape[1:])
+                  for name, _, data, count, _ in fetched]
+        if not self._matches(fields):
+            self._allocate(fields)
+
+        stats = []
+        self.partial = []
+        for name, handle, data, count, fetch_time in fetched:
+            if count is None:
+                self.buffer[name][0] = data
+                samples, nbytes = data.size, data.nbytes
+            else:
+                start = time.perf_counter()
+                done = self._fetch_chunks(name, handle, data,
+                                          self.buffer[name][0])
+                fetch_time += time.perf_counter() - start
+                if done < count:
+                    self.partial.append(name)
+                samples, nbytes = done * data.size, done * data.nbytes
+            dataloss = handle.has_dataloss()
+            if dataloss:
+                logger.warning(f"{name} might have data loss")
+            stats.append((name, samples, nbytes, fetch_time, dataloss))
+
+        self._record(stats, report)
+
+        if self.publisher is not None:
+            self.publisher.publish({name: self.buffer[name][0]
+                                    for name in self.buffer.dtype.names})
+
+        return self.buffer
+
+    def sweep_telemetry(self):
+        """Telemetry of each stream aggregated over all the jobs.
+
+        """
+        telemetry = np.zeros(len(self._sweep), dtype=SWEEP_TELEMETRY_DTYPE)
+        for i, (name, totals) in enumerate(self._sweep.items()):
+            points, samples, nbytes, fetch_time, dataloss = totals
+            throughput = nbytes / fetch_time if fetch_time > 0 else 0.0
+            telemetry[i] = (name, points, samples, nbytes, fetch_time,
+                            dataloss, throughput)
+        return telemetry
+
+    def close(self):
+        """Release the buffer and delete its memory mapped files.
+
+        The directory is reset, so that the next measurement can map the
+        buffer elsewhere.
+
+        """
+        self.buffer = None
+        self.directory = None
+        files, self._files = self._files, []
+        for path in files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # On Windows a file cannot be deleted while it is mapped.
+                logger.warning(f"Couldn't delete the result buffer {path}: "
+                               f"{e}")
+
+    def _fetch_start(self, name, handle):
+        """Fetch a stream or only its first sample if it is too large.
+
+        Returns
+        -------
+        data : np.ndarray
+            All the data or the first sample (as a one element array).
+
+        count : int or None
+            Number of samples to fetch by chunks, None if all the data
+            were fetched.
+
+        """
+        if self.chunk_size and self._accumulates(name, handle):
+            count = handle.count_so_far()
+            if count > 1:
+                first = handle.fetch(slice(0, 1), flat_struct=True)
+                if first is not None and first.nbytes * count > \
+                        self.chunk_size:
+                    return first, count
+        return handle.fetch_all(flat_struct=True), None
+
+    def _accumulates(self, name, handle):
+        """Whether the handle of a stream holds all the values saved.
+
+        """
+        info = self._streams.get(name)
+        if info is not None and info.source != 'declared':
+            return info.accumulates
+        return callable(getattr(handle, 'count_so_far', None))
+
+    def _fetch_chunks(self, name, handle, first, destination):
+        """Fetch a stream by chunks into its destination.
+
+        Returns the number of samples fetched.
+
+        """
+        count = len(destination)
+        step = max(self.chunk_size // max(first.nbytes, 1), 1)
+        destination[:1] = first
+        done = 1
+        last_log = time.monotonic()
+        while done < count:
+            if self.should_stop is not None and self.should_stop.is_set():
+                logger.warning(f"Fetching of {name} interrupted after "
+                               f"{done}/{count} samples")
+                break
+            stop = min(done + step, count)
+            destination[done:stop] = handle.fetch(slice(done, stop),
+                                                  flat_struct=True)
+            done = stop
+            if time.monotonic() - last_log > 1:
+                logger.info(f"Fetching {name}: {done}/{count} samples")
+                last_log = time.monotonic()
+        return done
+
+    def _record(self, stats, report):
+        """Update the telemetry of the last job and of the sweep.
+
+        """
+        self.telemetry = np.array(stats, dtype=TELEMETRY_DTYPE)
+        for name, samples, nbytes, fetch_time, dataloss in stats:
+            totals = self._sweep.setdefault(name, [0, 0, 0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += samples
+            totals[2] += nbytes
+            totals[3] += fetch_time
+            totals[4] += int(dataloss)
+
+        self.errors = []
+        if report is not None and report.has_errors():
+            for e in report.errors():
+                logger.warning(e)
+                self.errors.append(str(e))
+        self.error_count += len(self.errors)
+
+    def _matches(self, fields):
+        """Check whether the buffer can hold the given fields.
+
+        """
+        if self.buffer is None:
+            return False
+        dtype = self.buffer.dtype
+        if len(dtype.names) != len(fields):
+            return False
+        for name, field_dtype, shape in fields:
+            if name not in dtype.fields:
+                return False
+            sub = dtype[name]
+            if sub.base != field_dtype or sub.shape != tuple(shape):
+                return False
+        return True
+
+    def _allocate(self, fields):
+        if self.buffer is not None:
+            logger.debug("Layout of the results changed, reallocating the "
+                         "result buffer")
+        if self.directory is not None:
+            directory = Path(self.directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            # Unique names so that no other collector or measurement,
+            # possibly still reading its buffer, is overwritten.
+            fd, path = tempfile.mkstemp(suffix='.npy', prefix='results_',
+                                        dir=directory)
+            os.close(fd)
+            self._files.append(path)
+            self.buffer = np.lib.format.open_memmap(
+                path, mode='w+', dtype=np.dtype(fields), shape=(1,))
+        else:
+            self.buffer = np.zeros(1, dtype=fields)
+        self.allocations += 1
+
+
+class WindowCollector(ResultCollector):
+    """Collect the last samples of continuously growing streams.
+
+    Meant for programs running indefinitely and saving their streams
+    with save_all. At each call only the samples acquired since the
+    previous one are fetched (using count_so_far) and copied in a fixed
+    size ring buffer per stream. The buffer returned by collect holds,
+    for each stream, the last window samples ordered from the oldest to
+    the newest, zero padded at the start until enough samples were
+    acquired. The cost of a call hence does not depend on how long the
+    program has been running.
+
+    Parameters
+    ----------
+    window : int
+        Number of samples kept for each stream.
+
+    """
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        #: Total number of samples acquired for each stream.
+        self.acquired = {}
+        self._offsets = {}
+        self._rings = {}
+
+    def collect(self, results, report=None):
+        """Fetch the new samples and update the window of each stream.
+
+        """
+        stats = []
+        for name, handle in results:
+            offset = self._offsets.get(name, 0)
+            count = handle.count_so_far()
+            if count < offset:
+                # A new job started, its samples follow the previous ones.
+                offset = 0
+            first = max(offset, count - self.window)
+            start = time.perf_counter()
+            data = None
+            if count > first:
+                data = handle.fetch(slice(first, count), flat_struct=True)
+            fetch_time = time.perf_counter() - start
+            dataloss = handle.has_dataloss()
+            if dataloss:
+                logger.warning(f"{name} might have data loss")
+            self._offsets[name] = count
+
+            if data is not None and len(data):
+                self._push(name, data, count - offset)
+            stats.append((name, 0 if data is None else data.size,
+                          0 if data is None else data.nbytes, fetch_time,
+                          dataloss))
+
+        self._record(stats, report)
+
+        fields = [(name, ring.dtype, ring.shape)
+                  for name, ring in self._rings.items()]
+        if not self._matches(fields):
+            self._allocate(fields)
+
+        for name, ring in self._rings.items():
+            # Order the window from the oldest to the newest sample.
+            head = self.acquired[name] % self.window
+            window = self.buffer[name][0]
+            window[:self.window - head] = ring[head:]
+            window[self.window - head:] = ring[:head]
+
+        if self.publisher is not None:
+            self.publisher.publish({name: self.buffer[name][0]
+                                    for name in self.buffer.dtype.names})
+
+        return self.buffer
+
+    def _push(self, name, data, new):
+        """Copy the new samples at the head of the ring of a stream.
+
+        Only the last samples are fetched when more than a window was
+        acquired, new being the number of samples actually acquired.
+
+        """
+        ring = self._rings.get(name)
+        if (ring is None or ring.dtype != data.dtype
+                or ring.shape[1:] != data.shape[1:]):
+            ring = np.zeros((self.window,) + data.shape[1:], data.dtype)
+            self._rings[name] = ring
+            self.acquired[name] = 0
+
+        total = self.acquired[name] + new
+        indices = np.arange(total - len(data), total) % self.window
+        ring[indices] = data
+        self.acquired[name] = total
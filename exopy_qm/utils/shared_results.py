@@ -0,0 +1,365 @@
+"""Publication of the fetched streams in shared memory ring buffers.
+
+The streams published under a prefix are described by a descriptor
+segment named <prefix>_index containing a generation counter followed by
+a JSON document mapping each stream to its data segment, dtype, shape
+and number of slots. The generation is incremented each time the
+descriptor changes.
+
+Each data segment starts with a 256 bytes header holding, at offset 0, a
+u64 sequence number (number of items published so far, item n being
+stored in slot n % slots) and at offset 8 a u64 state (1 while the
+segment is in use, 0 once it is closed). Each slot is made of a u64 slot
+sequence number followed by the data. The writer sets the slot sequence
+to 0 before writing an item and to n + 1 once the item is written, then
+updates the segment sequence number. A reader can hence check that an
+item was not overwritten while it was reading it.
+
+"""
+import json
+import logging
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Size of the header of the data segments.
+HEADER_SIZE = 256
+
+#: Size of the descriptor segment.
+DESCRIPTOR_SIZE = 1 << 16
+
+#: Size of the sequence number preceding the data in each slot.
+SLOT_HEADER_SIZE = 8
+
+_U64 = struct.Struct('<Q')
+_DESCRIPTOR_HEADER = struct.Struct('<QQ')
+
+#: Names of the segments created by this process and not yet unlinked.
+_created = set()
+
+
+def _create_segment(name, size):
+    """Create a segment, replacing the one left by an interrupted run.
+
+    """
+    try:
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+    except FileExistsError:
+        logger.warning(f"Shared memory segment {name} already exists, it "
+                       f"is replaced")
+        stale = shared_memory.SharedMemory(name)
+        stale.close()
+        stale.unlink()
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+    _created.add(shm.name)
+    return shm
+
+
+def _unlink_segment(shm):
+    """Destroy a segment created by this process.
+
+    """
+    _created.discard(shm.name)
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def open_publisher(root, name, slots):
+    """Get the publisher of a measurement, creating it if necessary.
+
+    The publisher is stored in the resources of the root task so that its
+    segments are released at the end of the measurement.
+
+    """
+    files = root.resources['files']
+    key = f'shared_memory_{name}'
+    if key not in files:
+        files[key] = SharedStreamPublisher(name, slots)
+    return files[key]
+
+
+def _attach(name):
+    """Attach to an existing segment without taking its ownership.
+
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if sys.platform != 'win32' and name not in _created:
+        # Avoid the segment being unlinked when the reader exits. A segment
+        # created by this process stays registered, since its publisher
+        # unregisters it when unlinking it.
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class _Ring(object):
+    """Ring buffer of fixed size items stored in a shared memory segment.
+
+    """
+
+    def __init__(self, shm, dtype, shape, slots):
+        self.shm = shm
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.item_nbytes = self.dtype.itemsize * int(np.prod(self.shape))
+        self.slot_nbytes = SLOT_HEADER_SIZE + self.item_nbytes
+        # Keep items aligned on 8 bytes.
+        self.slot_nbytes += -self.slot_nbytes % 8
+
+    @classmethod
+    def size(cls, dtype, shape, slots):
+        item = np.dtype(dtype).itemsize * int(np.prod(shape))
+        slot = SLOT_HEADER_SIZE + item
+        return HEADER_SIZE + slots * (slot + -slot % 8)
+
+    @property
+    def sequence(self):
+        return _U64.unpack_from(self.shm.buf, 0)[0]
+
+    @property
+    def active(self):
+        return _U64.unpack_from(self.shm.buf, 8)[0] == 1
+
+    def slot_sequence(self, item):
+        offset = HEADER_SIZE + (item % self.slots) * self.slot_nbytes
+        return _U64.unpack_from(self.shm.buf, offset)[0]
+
+    def item_view(self, item):
+        offset = (HEADER_SIZE + (item % self.slots) * self.slot_nbytes
+                  + SLOT_HEADER_SIZE)
+        return np.ndarray(self.shape, self.dtype, self.shm.buf, offset)
+
+
+class SharedStreamPublisher(object):
+    """Publish the streams of each point in shared memory ring buffers.
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the names of the shared memory segments.
+
+    slots : int
+        Number of items kept for each stream.
+
+    """
+
+    def __init__(self, prefix, slots=4):
+        self.prefix = prefix
+        self.slots = max(int(slots), 1)
+        self._rings = {}
+        self._segments = 0
+        self._generation = 0
+        self._descriptor = _create_segment(f'{prefix}_index',
+                                           DESCRIPTOR_SIZE)
+        self._write_descriptor()
+
+    def publish(self, streams):
+        """Copy the streams in their ring buffer.
+
+        Parameters
+        ----------
+        streams : dict
+            Mapping between stream names and numpy arrays.
+
+        """
+        changed = False
+        for name, data in streams.items():
+            data = np.asarray(data)
+            ring = self._rings.get(name)
+            if (ring is None or ring.dtype != data.dtype
+                    or ring.shape != data.shape):
+                if ring is not None:
+                    self._release(ring)
+                ring = self._create(data.dtype, data.shape)
+                self._rings[name] = ring
+                changed = True
+
+            item = ring.sequence
+            slot = HEADER_SIZE + (item % ring.slots) * ring.slot_nbytes
+            buf = ring.shm.buf
+            _U64.pack_into(buf, slot, 0)
+            ring.item_view(item)[...] = data
+            _U64.pack_into(buf, slot, item + 1)
+            _U64.pack_into(buf, 0, item + 1)
+
+        if changed:
+            self._write_descriptor()
+
+    def close(self):
+        """Mark all the segments as closed and release them.
+
+        """
+        for ring in self._rings.values():
+            self._release(ring)
+        self._rings.clear()
+        if self._descriptor is not None:
+            _U64.pack_into(self._descriptor.buf, 8, 0)
+            self._descriptor.close()
+            _unlink_segment(self._descriptor)
+            self._descriptor = None
+
+    def _create(self, dtype, shape):
+        name = f'{self.prefix}_{self._segments}'
+        self._segments += 1
+        size = _Ring.size(dtype, shape, self.slots)
+        shm = _create_segment(name, size)
+        shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        _U64.pack_into(shm.buf, 8, 1)
+        return _Ring(shm, dtype, shape, self.slots)
+
+    def _release(self, ring):
+        _U64.pack_into(ring.shm.buf, 8, 0)
+        ring.shm.close()
+        _unlink_segment(ring.shm)
+
+    def _write_descriptor(self):
+        self._generation += 1
+        content = json.dumps({
+            name: {'segment': ring.shm.name, 'dtype': ring.dtype.str,
+                   'shape': list(ring.shape), 'slots': ring.slots}
+            for name, ring in self._rings.items()}).encode()
+        if len(content) > DESCRIPTOR_SIZE - _DESCRIPTOR_HEADER.size:
+            logger.error("Too many streams to describe them in shared memory")
+            return
+        buf = self._descriptor.buf
+        _DESCRIPTOR_HEADER.pack_into(buf, 0, 0, 1)
+        start = _DESCRIPTOR_HEADER.size
+        buf[start:start + len(content)] = content
+        buf[start + len(content)] = 0
+        _DESCRIPTOR_HEADER.pack_into(buf, 0, self._generation, 1)
+
+
+class SharedStreamReader(object):
+    """Read the streams published by a SharedStreamPublisher.
+
+    Meant to be used by the analysis processes.
+
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._descriptor = _attach(f'{prefix}_index')
+        self._generation = 0
+        self._rings = {}
+
+    @property
+    def streams(self):
+        """Names of the streams currently published.
+
+        """
+        self._refresh()
+        return list(self._rings)
+
+    @property
+    def active(self):
+        """Whether the publisher is still running.
+
+        """
+        return _U64.unpack_from(self._descriptor.buf, 8)[0] == 1
+
+    def sequence(self, name):
+        """Number of items published for a stream.
+
+        """
+        self._refresh()
+        return self._rings[name].sequence
+
+    def latest(self, name, copy=True, timeout=1.0):
+        """Get the last item published for a stream.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stream.
+
+        copy : bool
+            If False, the returned array is a view of the shared memory,
+            which stays valid as long as is_valid returns True for the
+            returned sequence number.
+
+        timeout : float
+            Maximal time in seconds spent retrying when the item is
+            overwritten while being read.
+
+        Returns
+        -------
+        sequence : int
+            Sequence number of the item (0 if nothing was published yet or
+            if the segment was released by the publisher).
+
+        data : np.ndarray or None
+            The item.
+
+        Raises
+        ------
+        TimeoutError
+            If no consistent item could be read before the timeout.
+
+        """
+        self._refresh()
+        ring = self._rings[name]
+        deadline = time.monotonic() + timeout
+        while True:
+            if not ring.active:
+                return 0, None
+            sequence = ring.sequence
+            if sequence == 0:
+                return 0, None
+            view = ring.item_view(sequence - 1)
+            data = view.copy() if copy else view
+            if ring.slot_sequence(sequence - 1) == sequence:
+                return sequence, data
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The items of {name} are overwritten "
+                                   f"faster than they can be read")
+
+    def is_valid(self, name, sequence):
+        """Check that an item was not overwritten since it was read.
+
+        """
+        return self._rings[name].slot_sequence(sequence - 1) == sequence
+
+    def close(self):
+        """Detach from all the segments.
+
+        """
+        for ring in self._rings.values():
+            ring.shm.close()
+        self._rings.clear()
+        self._descriptor.close()
+
+    def _refresh(self):
+        generation = _DESCRIPTOR_HEADER.unpack_from(self._descriptor.buf)[0]
+        if generation == self._generation or generation == 0:
+            return
+        start = _DESCRIPTOR_HEADER.size
+        raw = bytes(self._descriptor.buf[start:])
+        description = json.loads(raw[:raw.index(0)].decode())
+        if _DESCRIPTOR_HEADER.unpack_from(self._descriptor.buf)[0] != generation:
+            # The descriptor was updated while being read.
+            return self._refresh()
+
+        rings = {}
+        for name, desc in description.items():
+            ring = self._rings.get(name)
+            if ring is None or ring.shm.name != desc['segment']:
+                if ring is not None:
+                    ring.shm.close()
+                ring = _Ring(_attach(desc['segment']), desc['dtype'],
+                             desc['shape'], desc['slots'])
+            rings[name] = ring
+        for name, ring in self._rings.items():
+            if name not in rings:
+                ring.shm.close()
+        self._rings = rings
+        self._generation = generation
@@ -0,0 +1,171 @@
+"""Simulation of a program over a grid of parameters.
+
+"""
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: Dtype of the summary of each simulated point, times are in ns.
+SIMULATION_METRICS_DTYPE = np.dtype([('point', 'i8'), ('duration', 'i8'),
+                                     ('first_pulse', 'i8'),
+                                     ('last_pulse', 'i8'),
+                                     ('pulses', 'i8'), ('error', 'U256')])
+
+
+def parameter_grid(base, grid):
+    """List the parameters of all the points of a grid.
+
+    Parameters
+    ----------
+    base : dict
+        Values of the parameters which are not swept.
+
+    grid : dict or list
+        Either a mapping between parameter names and the values they take
+        (all the combinations are simulated, the last parameter varying
+        the fastest) or a list of dictionaries each describing a point.
+
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        points = [dict(zip(names, values))
+                  for values in itertools.product(*grid.values())]
+    else:
+        points = list(grid)
+    return [dict(base, **point) for point in points]
+
+
+def simulated_channels(samples):
+    """Flatten simulated samples into a channel name to array mapping.
+
+    Channels are named <controller>:<analog|digital>:<port>.
+
+    """
+    controllers = getattr(samples, '_controllers', None)
+    if controllers is None:
+        controllers = vars(samples)
+    channels = {}
+    for con, con_samples in controllers.items():
+        for kind in ('analog', 'digital'):
+            for port, values in getattr(con_samples, kind, {}).items():
+                channels[f'{con}:{kind}:{port}'] = np.asarray(values)
+    return channels
+
+
+def _metrics(channels):
+    """Duration and pulse timing of the samples of one point.
+
+    A pulse is a span during which at least one channel is non zero.
+
+    """
+    if not channels:
+        return 0, -1, -1, 0
+    duration = max(len(v) for v in channels.values())
+    active = np.zeros(duration, dtype=bool)
+    for values in channels.values():
+        active[:len(values)] |= values != 0
+    edges = np.flatnonzero(np.diff(active.astype(np.int8)))
+    if not active.any():
+        return duration, -1, -1, 0
+    first = int(np.argmax(active))
+    last = int(duration - np.argmax(active[::-1]))
+    pulses = int(np.count_nonzero(~active[edges])) + int(active[0])
+    return duration, first, last, pulses
+
+
+class SimulationBatch(object):
+    """Result of the simulation of a grid of parameters.
+
+    Attributes
+    ----------
+    parameters : list
+        Parameters of each point.
+
+    samples : dict
+        Mapping between channel names and the samples of all the points
+        stacked in a (points, duration) array, zero padded to the longest
+        point.
+
+    metrics : np.ndarray
+        Summary of each point (see SIMULATION_METRICS_DTYPE), the error
+        field holding the error message of the points which failed.
+
+    """
+
+    def __init__(self, parameters, channels, errors):
+        self.parameters = parameters
+        self.metrics = np.zeros(len(parameters),
+                                dtype=SIMULATION_METRICS_DTYPE)
+        names = sorted({name for c in channels if c for name in c})
+        self.samples = {}
+        for name in names:
+            length = max(len(c.get(name, ())) for c in channels if c)
+            dtype = np.result_type(*[c[name].dtype for c in channels
+                                     if c and name in c])
+            stacked = np.zeros((len(parameters), length), dtype=dtype)
+            for i, c in enumerate(channels):
+                if c and name in c:
+                    stacked[i, :len(c[name])] = c[name]
+            self.samples[name] = stacked
+
+        for i, (c, error) in enumerate(zip(channels, errors)):
+            if error:
+                self.metrics[i] = (i, 0, -1, -1, 0, error[:256])
+            else:
+                self.metrics[i] = (i,) + _metrics(c) + ('',)
+
+
+def simulate_grid(driver, points, duration, max_workers=4):
+    """Simulate the programs of several points concurrently.
+
+    The simulations run on a bounded pool of threads sharing the
+    connection of the driver to the manager. They spend most of their
+    time waiting for the server, so threads are enough to overlap them.
+
+    Parameters
+    ----------
+    driver : QuantumMachine
+        Driver used to run the simulations.
+
+    points : list
+        (config, program) tuple of each point. The programs should be
+        built beforehand in the calling thread since QUA programs are
+        not built in a thread safe way.
+
+    duration : int
+        Duration of the simulations in clock cycles (4 ns).
+
+    max_workers : int
+        Maximal number of simulations running at the same time.
+
+    Returns
+    -------
+    channels : list
+        Simulated samples of each point (see simulated_channels), None for
+        the points which failed.
+
+    errors : list
+        Error message of each point, empty if the simulation succeeded.
+
+    """
+    def run(point):
+        config, program = point
+        job = driver.simulate(config, program, duration)
+        return simulated_channels(job.get_simulated_samples())
+
+    channels, errors = [], []
+    with ThreadPoolExecutor(max_workers=max(int(max_workers), 1)) as pool:
+        futures = [pool.submit(run, point) for point in points]
+        for i, future in enumerate(futures):
+            try:
+                channels.append(future.result())
+                errors.append('')
+            except Exception as e:
+                logger.error(f"Simulation of the point {i} failed: {e}")
+                channels.append(None)
+                errors.append(str(e) or type(e).__name__)
+    return channels, errors
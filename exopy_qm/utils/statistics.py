@@ -0,0 +1,73 @@
+"""Running statistics of partially acquired data.
+
+"""
+import numpy as np
+
+
+class RunningStats(object):
+    """Running mean and variance of a stream of samples.
+
+    Samples are added by batches along the first axis and merged with the
+    previous ones using the parallel formulation of Welford's algorithm,
+    so that each update is a few vectorized operations whatever the
+    number of samples already accumulated.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def update(self, batch):
+        """Add a batch of samples, the first axis indexing the samples.
+
+        """
+        batch = np.asarray(batch, dtype=float)
+        n_batch = batch.shape[0] if batch.ndim else 0
+        if n_batch == 0:
+            return
+
+        mean_batch = batch.mean(axis=0)
+        m2_batch = ((batch - mean_batch)**2).sum(axis=0)
+        if self.count == 0:
+            self.count = n_batch
+            self.mean = mean_batch
+            self._m2 = m2_batch
+            return
+
+        total = self.count + n_batch
+        delta = mean_batch - self.mean
+        self.mean = self.mean + delta * (n_batch / total)
+        self._m2 = (self._m2 + m2_batch
+                    + delta**2 * (self.count * n_batch / total))
+        self.count = total
+
+    @property
+    def variance(self):
+        """Unbiased variance of the samples.
+
+        """
+        if self.count < 2:
+            return np.inf
+        return self._m2 / (self.count - 1)
+
+    @property
+    def standard_error(self):
+        """Standard error of the mean.
+
+        """
+        if self.count < 2:
+            return np.inf
+        return np.sqrt(self.variance / self.count)
+
+    @property
+    def snr(self):
+        """Ratio between the absolute mean and its standard error.
+
+        """
+        if self.count < 2:
+            return 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.nan_to_num(np.abs(self.mean) / self.standard_error,
+                                 nan=0.0, posinf=np.inf)
@@ -0,0 +1,496 @@
+"""Static discovery of the streams saved by a QUA program file.
+
+The program file is parsed once and walked in a single pass. Stream names
+are resolved through constants, f-strings, str.format and simple helper
+functions (functions whose body is a single return statement). The shape
+and dtype of each stream are inferred from its stream_processing chain
+whenever possible.
+
+Literals are expected as ast.Constant nodes, which requires Python 3.8
+(the minimal version supported by the package).
+
+"""
+import ast
+import logging
+
+logger = logging.getLogger(__name__)
+
+#: Dtype of the values stored in a QUA variable, by declaration type.
+QUA_DTYPES = {'int': 'int64', 'fixed': 'float64', 'bool': 'bool'}
+
+
+class StreamInfo(object):
+    """Description of a stream saved by a QUA program.
+
+    The shape is the one of the array returned by
+    fetch_all(flat_struct=True). Dimensions that cannot be determined
+    statically are None, as is the whole shape or the dtype when they
+    cannot be inferred at all.
+
+    The source is the way the stream is saved: 'save' or 'save_all' for
+    the stream_processing section, 'tag' for variables saved directly
+    under a name, 'adc' for raw ADC data and 'declared' for streams
+    described by a get_streams function.
+
+    """
+    __slots__ = ('name', 'shape', 'dtype', 'source')
+
+    def __init__(self, name, shape=None, dtype=None, source='save'):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.source = source
+
+    @property
+    def is_static(self):
+        """Whether the shape and the dtype are fully known.
+
+        """
+        return (self.dtype is not None and self.shape is not None
+                and None not in self.shape)
+
+    @property
+    def accumulates(self):
+        """Whether the handle holds all the values saved, not only the last.
+
+        """
+        return self.source in ('save_all', 'tag', 'adc')
+
+    def __repr__(self):
+        return (f"StreamInfo({self.name!r}, shape={self.shape!r}, "
+                f"dtype={self.dtype!r}, source={self.source!r})")
+
+
+class _Unresolved(Exception):
+    """Raised when an expression cannot be evaluated statically.
+
+    """
+    pass
+
+
+class _StreamExpr(object):
+    """Partially evaluated stream_processing chain.
+
+    """
+    __slots__ = ('item_shape', 'dtype')
+
+    def __init__(self, item_shape=(), dtype=None):
+        self.item_shape = item_shape
+        self.dtype = dtype
+
+
+class _ProgramAnalyzer(ast.NodeVisitor):
+    """Single pass visitor collecting the streams of a QUA program.
+
+    """
+
+    def __init__(self, helpers):
+        self.helpers = helpers
+        self.scopes = [{}]
+        self.variables = [{}]
+        self.stream_aliases = [{}]
+        self.stream_dtypes = {}
+        self.adc_streams = set()
+        self.streams = {}
+        self.unresolved = 0
+
+    # --- Scopes -------------------------------------------------------------
+
+    def visit_FunctionDef(self, node):
+        self.scopes.append({})
+        self.variables.append({})
+        self.stream_aliases.append({})
+        self.generic_visit(node)
+        self.scopes.pop()
+        self.variables.pop()
+        self.stream_aliases.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _lookup(self, stack, name):
+        for scope in reversed(stack):
+            if name in scope:
+                return scope[name]
+        raise KeyError(name)
+
+    # --- Assignments --------------------------------------------------------
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        if len(node.targets) != 1:
+            return
+        target = node.targets[0]
+        if isinstance(target, ast.Name):
+            self._record_assignment(target.id, node.value)
+        elif (isinstance(target, (ast.Tuple, ast.List))
+                and isinstance(node.value, (ast.Tuple, ast.List))
+                and len(target.elts) == len(node.value.elts)):
+            for t, v in zip(target.elts, node.value.elts):
+                if isinstance(t, ast.Name):
+                    self._record_assignment(t.id, v)
+
+    def visit_AnnAssign(self, node):
+        self.generic_visit(node)
+        if isinstance(node.target, ast.Name) and node.value is not None:
+            self._record_assignment(node.target.id, node.value)
+
+    def _record_assignment(self, name, value):
+        # Forget any previous meaning of the name in the current scope.
+        self.scopes[-1].pop(name, None)
+        self.variables[-1].pop(name, None)
+        self.stream_aliases[-1].pop(name, None)
+
+        func = _call_name(value)
+        if func == 'declare' and value.args:
+            qua_type = _call_name_of(value.args[0])
+            self.variables[-1][name] = QUA_DTYPES.get(qua_type)
+        elif func == 'declare_stream':
+            if any(k.arg == 'adc_trace' and _is_true(k.value)
+                   for k in value.keywords):
+                self.adc_streams.add(name)
+        else:
+            try:
+                self.scopes[-1][name] = self._resolve(value)
+            except _Unresolved:
+                if (isinstance(value, ast.Call)
+                        and isinstance(value.func, ast.Attribute)):
+                    self.stream_aliases[-1][name] = value
+
+    # --- Calls --------------------------------------------------------------
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if isinstance(func, ast.Name):
+            if func.id == 'save' and len(node.args) >= 2:
+                self._visit_save(node)
+            elif func.id == 'measure' and len(node.args) >= 3:
+                self._visit_measure(node)
+        elif (isinstance(func, ast.Attribute)
+                and func.attr in ('save', 'save_all') and node.args):
+            self._visit_stream_save(node)
+
+    def _visit_save(self, node):
+        var, target = node.args[0], node.args[1]
+        dtype = None
+        if isinstance(var, ast.Name):
+            try:
+                dtype = self._lookup(self.variables, var.id)
+            except KeyError:
+                pass
+
+        if isinstance(target, ast.Name) and not self._is_constant(target.id):
+            # Saving into a declared stream: remember the type of the
+            # values for the stream_processing section.
+            if dtype is not None:
+                self.stream_dtypes.setdefault(target.id, dtype)
+            return
+
+        name = self._resolve_name(target)
+        if name is not None:
+            self._add(StreamInfo(name, (None,), dtype, 'tag'))
+
+    def _visit_measure(self, node):
+        target = node.args[2]
+        if isinstance(target, ast.Constant) and target.value is None:
+            return
+        if isinstance(target, ast.Name) and not self._is_constant(target.id):
+            self.adc_streams.add(target.id)
+            return
+        # The raw data of both inputs are returned in separate handles.
+        name = self._resolve_name(target)
+        if name is not None:
+            for suffix in ('_input1', '_input2'):
+                self._add(StreamInfo(name + suffix, (None,), None, 'adc'))
+
+    def _visit_stream_save(self, node):
+        name = self._resolve_name(node.args[0])
+        if name is None:
+            return
+        try:
+            expr = self._evaluate_chain(node.func.value)
+        except _Unresolved:
+            self._add(StreamInfo(name, None, None, node.func.attr))
+            return
+
+        shape = expr.item_shape
+        if shape is not None and node.func.attr == 'save_all':
+            shape = (None,) + shape
+        self._add(StreamInfo(name, shape, expr.dtype, node.func.attr))
+
+    def _add(self, info):
+        # A stream saved at several places keeps the first description
+        # unless they disagree, in which case nothing is assumed.
+        known = self.streams.get(info.name)
+        if known is None:
+            self.streams[info.name] = info
+        elif known.shape != info.shape or known.dtype != info.dtype:
+            self.streams[info.name] = StreamInfo(info.name, source=known.source)
+
+    # --- Stream processing chains -------------------------------------------
+
+    def _evaluate_chain(self, node):
+        """Compute the item shape and dtype of a stream expression.
+
+        """
+        if isinstance(node, ast.Name):
+            try:
+                alias = self._lookup(self.stream_aliases, node.id)
+            except KeyError:
+                dtype = self.stream_dtypes.get(node.id)
+                shape = ()
+                if node.id in self.adc_streams:
+                    dtype, shape = None, (None,)
+                return _StreamExpr(shape, dtype)
+            return self._evaluate_chain(alias)
+
+        if not (isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Attribute)):
+            raise _Unresolved
+
+        expr = self._evaluate_chain(node.func.value)
+        op = node.func.attr
+        shape, dtype = expr.item_shape, expr.dtype
+
+        if op == 'buffer':
+            dims = tuple(self._resolve_dim(a) for a in node.args)
+            shape = None if shape is None else dims + shape
+        elif op == 'average':
+            dtype = 'float64'
+        elif op == 'map' and node.args:
+            shape, dtype = self._evaluate_map(node.args[0], shape, dtype)
+        elif op in ('input1', 'input2'):
+            shape = (None,)
+        elif op == 'boolean_to_int':
+            dtype = 'int64'
+        elif op in ('take', 'skip', 'skip_last', 'flatten'):
+            if op == 'flatten' and shape:
+                shape = (None,) if None in shape else (_prod(shape),)
+        elif op in ('timestamps', 'with_timestamps', 'zip', 'tuple'):
+            dtype = None
+        else:
+            shape, dtype = None, None
+
+        return _StreamExpr(shape, dtype)
+
+    def _evaluate_map(self, func, shape, dtype):
+        op = _call_name(func)
+        if op == 'average':
+            if shape is None:
+                return None, 'float64'
+            axis = func.args[0] if func.args else None
+            if axis is None:
+                return (), 'float64'
+            try:
+                axis = self._resolve(axis)
+                return (shape[:axis] + shape[axis + 1:], 'float64')
+            except (_Unresolved, TypeError):
+                return None, 'float64'
+        elif op in ('real', 'image', 'demod'):
+            return shape, 'float64'
+        return None, None
+
+    def _resolve_dim(self, node):
+        try:
+            value = self._resolve(node)
+        except _Unresolved:
+            return None
+        return value if isinstance(value, int) else None
+
+    # --- Constant resolution ------------------------------------------------
+
+    def _is_constant(self, name):
+        try:
+            self._lookup(self.scopes, name)
+        except KeyError:
+            return False
+        return True
+
+    def _resolve_name(self, node):
+        try:
+            name = self._resolve(node)
+        except _Unresolved:
+            self.unresolved += 1
+            logger.debug(f"Unable to resolve the stream name at line "
+                         f"{getattr(node, 'lineno', '?')}")
+            return None
+        return name if isinstance(name, str) else None
+
+    def _resolve(self, node, scope=None):
+        if isinstance(node, ast.Constant):
+            return node.value
+
+        if isinstance(node, ast.Name):
+            if scope is not None and node.id in scope:
+                return scope[node.id]
+            try:
+                return self._lookup(self.scopes, node.id)
+            except KeyError:
+                raise _Unresolved
+
+        if isinstance(node, ast.JoinedStr):
+            parts = []
+            for value in node.values:
+                if isinstance(value, ast.FormattedValue):
+                    v = self._resolve(value.value, scope)
+                    if value.conversion == ord('r'):
+                        v = repr(v)
+                    elif value.conversion == ord('s'):
+                        v = str(v)
+                    elif value.conversion == ord('a'):
+                        v = ascii(v)
+                    spec = ''
+                    if value.format_spec is not None:
+                        spec = self._resolve(value.format_spec, scope)
+                    parts.append(format(v, spec))
+                else:
+                    parts.append(self._resolve(value, scope))
+            return ''.join(parts)
+
+        if isinstance(node, ast.BinOp):
+            left = self._resolve(node.left, scope)
+            right = self._resolve(node.right, scope)
+            try:
+                if isinstance(node.op, ast.Add):
+                    return left + right
+                if isinstance(node.op, ast.Sub):
+                    return left - right
+                if isinstance(node.op, ast.Mult):
+                    return left * right
+                if isinstance(node.op, ast.FloorDiv):
+                    return left // right
+                if isinstance(node.op, ast.Mod):
+                    return left % right
+            except Exception:
+                raise _Unresolved
+            raise _Unresolved
+
+        if isinstance(node, ast.Call):
+            return self._resolve_call(node, scope)
+
+        raise _Unresolved
+
+    def _resolve_call(self, node, scope):
+        args = [self._resolve(a, scope) for a in node.args]
+        kwargs = {k.arg: self._resolve(k.value, scope)
+                  for k in node.keywords if k.arg is not None}
+        func = node.func
+
+        if (isinstance(func, ast.Attribute) and func.attr == 'format'):
+            template = self._resolve(func.value, scope)
+            if isinstance(template, str):
+                try:
+                    return template.format(*args, **kwargs)
+                except Exception:
+                    raise _Unresolved
+
+        if isinstance(func, ast.Name):
+            if func.id in ('str', 'int') and len(args) == 1 and not kwargs:
+                return (str if func.id == 'str' else int)(args[0])
+            helper = self.helpers.get(func.id)
+            if helper is not None:
+                return self._resolve_helper(helper, args, kwargs)
+
+        raise _Unresolved
+
+    def _resolve_helper(self, helper, args, kwargs):
+        params, defaults, body = helper
+        if len(args) > len(params):
+            raise _Unresolved
+        local = dict(defaults)
+        local.update(zip(params, args))
+        local.update(kwargs)
+        if any(p not in local for p in params):
+            raise _Unresolved
+        return self._resolve(body, local)
+
+
+def _collect_helpers(root):
+    """Find the top-level functions consisting of a single return.
+
+    """
+    helpers = {}
+    for node in root.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        body = node.body
+        if (body and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)):
+            body = body[1:]
+        if len(body) != 1 or not isinstance(body[0], ast.Return):
+            continue
+        if body[0].value is None:
+            continue
+
+        params = [a.arg for a in node.args.args]
+        defaults = {}
+        for arg, default in zip(reversed(node.args.args),
+                                reversed(node.args.defaults)):
+            if isinstance(default, ast.Constant):
+                defaults[arg.arg] = default.value
+        helpers[node.name] = (params, defaults, body[0].value)
+
+    return helpers
+
+
+def _call_name(node):
+    """Name of the function called by a Call node, if it is a simple one.
+
+    """
+    if isinstance(node, ast.Call):
+        return _call_name_of(node.func)
+    return None
+
+
+def _call_name_of(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _is_true(node):
+    return isinstance(node, ast.Constant) and node.value is True
+
+
+def _prod(shape):
+    result = 1
+    for dim in shape:
+        result *= dim
+    return result
+
+
+def find_streams(source, filename='<program>'):
+    """Find the streams saved by a QUA program.
+
+    Parameters
+    ----------
+    source : str
+        Source code of the program file.
+
+    filename : str
+        Name of the file used in error messages.
+
+    Returns
+    -------
+    streams : dict
+        Mapping between the stream names and their StreamInfo.
+
+    Raises
+    ------
+    SyntaxError
+        If the source cannot be parsed.
+
+    """
+    root = ast.parse(source, filename)
+    analyzer = _ProgramAnalyzer(_collect_helpers(root))
+    analyzer.visit(root)
+
+    if analyzer.unresolved:
+        logger.info(f"{analyzer.unresolved} stream name(s) in {filename} "
+                    f"could not be resolved statically, they will be "
+                    f"discovered when fetching the results")
+
+    return analyzer.streams
@@ -0,0 +1,168 @@
+"""Tools used to anticipate the next point of an exopy loop.
+
+"""
+import logging
+import re
+from decimal import Decimal
+
+import numpy as np
+from exopy.tasks.tasks.string_evaluation import safe_eval
+
+logger = logging.getLogger(__name__)
+
+#: Regex matching the database entries referenced in a formula.
+_ENTRY_REGEX = re.compile(r'\{([^{}]+)\}')
+
+
+def find_parent_loop(task):
+    """Find the innermost loop task containing the task.
+
+    """
+    parent = task.parent
+    while parent is not None:
+        if hasattr(parent, 'perform_loop'):
+            return parent
+        parent = parent.parent
+    return None
+
+
+def loop_values(loop):
+    """Values iterated over by a loop, computed as its interface does.
+
+    The values of a linspace interface are rounded to the number of
+    decimals of the step, as exopy does, so that they are equal to the
+    values written in the database by the loop.
+
+    Returns None if the interface of the loop is not supported.
+
+    """
+    interface = loop.interface
+    if all(hasattr(interface, a) for a in ('start', 'stop', 'step')):
+        start = loop.format_and_eval_string(interface.start)
+        stop = loop.format_and_eval_string(interface.stop)
+        step = loop.format_and_eval_string(interface.step)
+        num = int(round(abs((stop - start) / step))) + 1
+        digits = abs(Decimal(str(step)).as_tuple().exponent)
+        return np.array([round(value, digits)
+                         for value in np.linspace(start, stop, num)])
+    elif hasattr(interface, 'iterable'):
+        return list(loop.format_and_eval_string(interface.iterable))
+    return None
+
+
+def runs_alone_in_loop(task):
+    """Whether the task is the only one executed by its parent loop.
+
+    Complex tasks holding nothing but the task are allowed between the
+    loop and the task.
+
+    """
+    loop = find_parent_loop(task)
+    if loop is None:
+        return False
+    child = task
+    while child is not loop:
+        if len(child.parent.children) != 1:
+            return False
+        child = child.parent
+    return True
+
+
+def next_point_overrides(task):
+    """Database values of the next iteration of the parent loop of a task.
+
+    Only the loops writing their current value in the database (ie
+    without an embedded task) are supported.
+
+    Returns
+    -------
+    overrides : dict or None
+        Mapping between database entries and their value at the next
+        point, None if there is no next point or if it cannot be
+        determined.
+
+    """
+    loop = find_parent_loop(task)
+    if loop is None or getattr(loop, 'task', None) is not None:
+        return None
+
+    try:
+        values = loop_values(loop)
+        index = task.get_from_database(f'{loop.name}_index')
+    except Exception as e:
+        logger.debug(f"Unable to determine the next point of {loop.name}: "
+                     f"{e}")
+        return None
+
+    if values is None or index >= len(values):
+        return None
+
+    return {f'{loop.name}_index': index + 1,
+            f'{loop.name}_value': values[index]}
+
+
+def eval_with_overrides(task, string, overrides):
+    """Format and evaluate a string, replacing some database values.
+
+    """
+    local_vars = {}
+
+    def replace(match):
+        entry = match.group(1)
+        key = f'_a{len(local_vars)}'
+        if entry in overrides:
+            local_vars[key] = overrides[entry]
+        else:
+            local_vars[key] = task.get_from_database(entry)
+        return key
+
+    return safe_eval(_ENTRY_REGEX.sub(replace, string), local_vars)
+
+
+def loop_indices(task):
+    """Current index of all the loops containing the task.
+
+    """
+    indices = {}
+    loop = find_parent_loop(task)
+    while loop is not None:
+        entry = f'{loop.name}_index'
+        try:
+            indices[entry] = task.get_from_database(entry)
+        except Exception:
+            pass
+        loop = find_parent_loop(loop)
+    return indices
+
+
+class QueuedJob(object):
+    """Job queued on a machine for the next point of a loop.
+
+    Queued jobs are stored in the resources of the root task so that they
+    are cancelled if the measurement stops before they are used.
+
+    Parameters
+    ----------
+    driver : QuantumMachine
+        Driver used to queue the job.
+
+    digest : str
+        Digest of the parameters of the point.
+
+    pending_job :
+        Pending job returned by the queue of the machine.
+
+    """
+
+    def __init__(self, driver, digest, pending_job):
+        self.driver = driver
+        self.digest = digest
+        self.pending_job = pending_job
+
+    def close(self):
+        """Cancel the job if it was not used.
+
+        """
+        if self.pending_job is not None:
+            self.driver.cancel_job(self.pending_job)
+            self.pending_job = None
@@ -32,13 +32,18 @@ setup(
         'Natural Language :: English',
         'Operating System :: OS Independent',
         'Topic :: Scientific/Engineering :: Physics',
-        'Programming Language :: Python :: 3.6'
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         ],
+    python_requires='>=3.8',
     zip_safe=False,
     packages=find_packages(exclude=['tests', 'tests.*']),
     data_files=["VERSION", "LICENSE"],
     package_data={'': ['*.enaml']},
     install_requires=['exopy', 'matplotlib'],
+    extras_require={'arrow': ['pyarrow']},
     entry_points={
         'exopy_package_extension':
         'exopy_qm = %s:list_manifests' % PROJECT_NAME}
@@ -0,0 +1,78 @@
+"""Tests for the mixer calibration table.
+
+"""
+import numpy as np
+import pytest
+
+from exopy_qm.utils.calibration import CalibrationTable
+
+
+@pytest.fixture
+def table():
+    # Corrections equal to (IF + LO) / 1e9 to check the interpolation.
+    mixers, ifs, los, corrections = [], [], [], []
+    for lo in (5e9, 6e9):
+        for intermediate_frequency in (-100e6, 0.0, 100e6):
+            mixers.append('mixer_qubit')
+            ifs.append(intermediate_frequency)
+            los.append(lo)
+            corrections.append([(intermediate_frequency + lo) / 1e9] * 4)
+    return CalibrationTable(mixers, ifs, los, corrections)
+
+
+def test_measured_points(table):
+    assert table.mixers == ['mixer_qubit']
+    assert table.correction('mixer_qubit', 100e6, 5e9) == (5.1,) * 4
+
+
+def test_interpolation_along_if(table):
+    values = table.corrections('mixer_qubit', [-50e6, 50e6], 6e9)
+    np.testing.assert_allclose(values, [[5.95] * 4, [6.05] * 4])
+
+
+def test_interpolation_between_lo(table):
+    np.testing.assert_allclose(table.correction('mixer_qubit', 50e6, 5.5e9),
+                               (5.55,) * 4)
+
+
+def test_out_of_range(table):
+    np.testing.assert_allclose(table.correction('mixer_qubit', 200e6, 7e9),
+                               (6.1,) * 4)
+    np.testing.assert_allclose(table.correction('mixer_qubit', -200e6, 4e9),
+                               (4.9,) * 4)
+
+
+def test_unknown_mixer(table):
+    with pytest.raises(KeyError):
+        table.corrections('mixer_rr', 0, 5e9)
+
+
+def test_inconsistent_columns():
+    with pytest.raises(ValueError):
+        CalibrationTable(['m'], [0, 1], [5e9], [[1, 0, 0, 1]])
+
+
+def test_load_csv(tmp_path):
+    path = tmp_path / 'calibration.csv'
+    path.write_text('mixer,intermediate_frequency,lo_frequency,'
+                    'c00,c01,c10,c11\n'
+                    'm,0,5e9,1,0,0,1\n'
+                    'm,1e8,5e9,1.1,0.1,0.1,0.9\n')
+    table = CalibrationTable.load(path)
+    np.testing.assert_allclose(table.correction('m', 5e7, 5e9),
+                               (1.05, 0.05, 0.05, 0.95))
+
+
+def test_load_npz(tmp_path):
+    path = tmp_path / 'calibration.npz'
+    np.savez(path, mixer=['m', 'm'], intermediate_frequency=[0, 1e8],
+             lo_frequency=[5e9, 5e9],
+             correction=[[[1, 0], [0, 1]], [[1.1, 0.1], [0.1, 0.9]]])
+    table = CalibrationTable.load(path)
+    np.testing.assert_allclose(table.correction('m', 1e8, 5e9),
+                               (1.1, 0.1, 0.1, 0.9))
+
+
+def test_load_unsupported(tmp_path):
+    with pytest.raises(ValueError):
+        CalibrationTable.load(tmp_path / 'calibration.json')
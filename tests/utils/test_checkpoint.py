@@ -0,0 +1,83 @@
+"""Tests for the checkpoints of the completed points.
+
+"""
+import json
+
+import numpy as np
+import pytest
+
+from exopy_qm.utils.checkpoint import CheckpointStore, file_digest
+
+
+@pytest.fixture
+def results():
+    results = np.zeros(1, dtype=[('I', 'f8', (3,)), ('n', 'i8')])
+    results['I'][0] = [1, 2, 3]
+    results['n'] = 7
+    return results
+
+
+def test_point_key():
+    key = CheckpointStore.point_key({'loop_index': 1}, {'a': 1.0})
+    assert key == CheckpointStore.point_key({'loop_index': 1}, {'a': 1.0})
+    assert key != CheckpointStore.point_key({'loop_index': 2}, {'a': 1.0})
+    assert key != CheckpointStore.point_key({'loop_index': 1}, {'a': 1.5})
+
+
+def test_save_and_load(tmp_path, results):
+    store = CheckpointStore(tmp_path / 'checkpoints')
+    assert 'key' not in store
+    store.save('key', results, {'parameters': {'a': 1.0}, 'value': 1j})
+    assert 'key' in store
+
+    loaded, metadata = store.load('key')
+    np.testing.assert_array_equal(loaded, results)
+    assert loaded.dtype == results.dtype
+    assert metadata['parameters'] == {'a': 1.0}
+    assert metadata['value'] == '1j'
+    assert metadata['key'] == 'key'
+
+
+def test_index(tmp_path, results):
+    store = CheckpointStore(tmp_path)
+    store.save('first', results, {'point': 0})
+    store.save('second', results, {'point': 1})
+    lines = (tmp_path / 'index.jsonl').read_text().splitlines()
+    assert [json.loads(line)['key'] for line in lines] == ['first', 'second']
+
+
+def test_reopened_store(tmp_path, results):
+    CheckpointStore(tmp_path).save('key', results, {})
+    assert 'key' in CheckpointStore(tmp_path)
+
+
+def test_atomic_write(tmp_path, results, monkeypatch):
+    store = CheckpointStore(tmp_path)
+    store.save('key', results, {})
+
+    def failing_savez(f, **arrays):
+        f.write(b'partial')
+        raise OSError('Disk full')
+
+    monkeypatch.setattr(np, 'savez', failing_savez)
+    results['n'] = 8
+    with pytest.raises(OSError):
+        store.save('key', results, {})
+    with pytest.raises(OSError):
+        store.save('other', results, {})
+    monkeypatch.undo()
+
+    # The failed writes neither corrupted nor created a point.
+    loaded, _ = store.load('key')
+    assert loaded['n'][0] == 7
+    assert 'other' not in store
+    assert len((tmp_path / 'index.jsonl').read_text().splitlines()) == 1
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / 'config.py'
+    path.write_text('a = 1\n')
+    digest = file_digest(path)
+    assert digest == file_digest(path)
+    path.write_text('a = 2\n')
+    assert digest != file_digest(path)
@@ -0,0 +1,104 @@
+"""Tests for the manipulation of QM configurations.
+
+"""
+import copy
+
+import numpy as np
+import pytest
+
+from exopy_qm.utils.config_tools import (compact_config, config_digest,
+                                         validate_config)
+
+
+@pytest.fixture
+def config():
+    return {
+        'version': 1,
+        'controllers': {
+            'con1': {'type': 'opx1',
+                     'analog_outputs': {1: {'offset': 0.0},
+                                        2: {'offset': 0.0}},
+                     'analog_inputs': {1: {'offset': 0.0}},
+                     'digital_outputs': {}}},
+        'elements': {
+            'qubit': {'mixInputs': {'I': ('con1', 1), 'Q': ('con1', 2),
+                                    'lo_frequency': 5e9,
+                                    'mixer': 'mixer_qubit'},
+                      'intermediate_frequency': 100e6,
+                      'operations': {'x': 'x_pulse', 'y': 'y_pulse'}}},
+        'pulses': {
+            'x_pulse': {'operation': 'control', 'length': 16,
+                        'waveforms': {'I': 'gauss', 'Q': 'zero'}},
+            'y_pulse': {'operation': 'control', 'length': 16,
+                        'waveforms': {'I': 'zero_bis', 'Q': 'gauss_copy'}}},
+        'waveforms': {
+            'gauss': {'type': 'arbitrary',
+                      'samples': list(0.2 * np.hanning(16))},
+            'gauss_copy': {'type': 'arbitrary',
+                           'samples': list(0.2 * np.hanning(16))},
+            'zero': {'type': 'constant', 'sample': 0.0},
+            'zero_bis': {'type': 'arbitrary', 'samples': [0.0] * 16}},
+        'mixers': {'mixer_qubit': [{'intermediate_frequency': 100e6,
+                                    'lo_frequency': 5e9,
+                                    'correction': [1, 0, 0, 1]}]},
+    }
+
+
+def test_digest_ignores_ordering():
+    assert (config_digest({'a': 1, 'b': [1, 2]})
+            == config_digest({'b': [1, 2], 'a': 1}))
+    assert config_digest({'a': 1}) != config_digest({'a': 1.0})
+    assert (config_digest(np.arange(3)) != config_digest(np.arange(3.)))
+
+
+def test_compact_config(config):
+    original = copy.deepcopy(config)
+    compacted, stats = compact_config(config)
+    assert config == original
+
+    assert stats['waveforms'] == 4
+    assert stats['compacted_waveforms'] == 2
+    assert stats['constants'] == 1
+    assert stats['merged'] == 2
+    assert set(compacted['waveforms']) == {'gauss', 'zero'}
+    assert compacted['pulses']['y_pulse']['waveforms'] == {'I': 'zero',
+                                                           'Q': 'gauss'}
+    assert not validate_config(compacted)
+
+
+def test_overridable_waveforms_untouched(config):
+    config['waveforms']['gauss_copy']['is_overridable'] = True
+    compacted, stats = compact_config(config)
+    assert 'gauss_copy' in compacted['waveforms']
+
+
+def test_scaled_copies_counted(config):
+    config['waveforms']['gauss_copy']['samples'] = list(0.1 * np.hanning(16))
+    _, stats = compact_config(config)
+    assert stats['scaled_copies'] == 1
+
+
+def test_valid_config(config):
+    assert validate_config(config) == []
+
+
+def test_invalid_references(config):
+    config['elements']['qubit']['operations']['z'] = 'z_pulse'
+    config['pulses']['x_pulse']['waveforms']['I'] = 'missing'
+    config['elements']['qubit']['mixInputs']['I'] = ('con2', 1)
+    errors = validate_config(config)
+    assert any('z_pulse' in e for e in errors)
+    assert any('missing' in e for e in errors)
+    assert any('con2' in e for e in errors)
+
+
+def test_invalid_waveforms(config):
+    config['waveforms']['gauss']['samples'] = [0.6] * 16
+    config['pulses']['x_pulse']['length'] = 18
+    errors = validate_config(config)
+    assert any('outside' in e for e in errors)
+    assert any('multiple of 4' in e for e in errors)
+
+
+def test_not_a_dict():
+    assert validate_config(None)
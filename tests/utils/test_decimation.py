@@ -0,0 +1,54 @@
+"""Tests for the decimated previews of long streams.
+
+"""
+import numpy as np
+import pytest
+
+from exopy_qm.utils.decimation import (decimate, parse_preview_streams,
+                                       preview_results)
+
+
+def test_minmax():
+    data = np.array([0, 5, 1, -3, 2, 2, 7, 1], dtype=float)
+    np.testing.assert_array_equal(decimate(data, 2, 'minmax'),
+                                  [-3, 5, 1, 7])
+
+
+def test_mean_uneven_bins():
+    data = np.arange(10.)
+    np.testing.assert_allclose(decimate(data, 3, 'mean'), [1, 4, 7.5])
+
+
+def test_last_axis():
+    data = np.arange(20.).reshape(2, 10)
+    preview = decimate(data, 2, 'mean')
+    np.testing.assert_allclose(preview, [[2, 7], [12, 17]])
+
+
+def test_small_data_copied():
+    data = np.arange(4.)
+    preview = decimate(data, 2, 'minmax')
+    np.testing.assert_array_equal(preview, data)
+    assert preview is not data
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        decimate(np.arange(10.), 2, 'median')
+
+
+def test_parse_preview_streams():
+    assert parse_preview_streams(' I, Q ,,') == ['I', 'Q']
+    assert parse_preview_streams('') == []
+
+
+def test_preview_results():
+    results = np.zeros(1, dtype=[('I', float, (100,)), ('n', int)])
+    results['I'][0] = np.arange(100.)
+    previews, kept = preview_results(results, ['I', 'missing'], 10, 'mean')
+    assert list(previews) == ['I']
+    assert previews['I'].shape == (10,)
+    assert kept.dtype.names == ('I', 'n')
+
+    previews, kept = preview_results(results, ['I'], 10, exclude=True)
+    assert kept.dtype.names == ('n',)
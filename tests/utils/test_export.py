@@ -0,0 +1,106 @@
+"""Tests for the Arrow/Parquet export of the streams.
+
+"""
+import numpy as np
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+from exopy_qm.utils.export import StreamExporter
+
+
+def read(directory, name, format):
+    if format == 'parquet':
+        return pq.read_table(str(directory / f'{name}.parquet'))
+    return pa.ipc.open_stream(str(directory / f'{name}.arrows')).read_all()
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_write_points(tmp_path, format):
+    exporter = StreamExporter(tmp_path, format)
+    exporter.write({'I': np.arange(6.).reshape(2, 3)},
+                   {'meas_id': 'm', 'point': 0})
+    exporter.write({'I': np.ones((2, 3))}, {'meas_id': 'm', 'point': 1})
+    exporter.close()
+
+    table = read(tmp_path, 'I', format).to_pydict()
+    assert table['meas_id'] == ['m', 'm']
+    assert table['point'] == [0.0, 1.0]
+    assert table['shape'] == [[2, 3], [2, 3]]
+    assert table['data'] == [list(range(6)), [1.0] * 6]
+
+
+def test_metadata_type_drift(tmp_path):
+    """Regression: a parameter changing from int to float dropped points.
+
+    """
+    exporter = StreamExporter(tmp_path)
+    exporter.write({'I': np.zeros(2)}, {'amplitude': 1, 'flag': True})
+    exporter.write({'I': np.zeros(2)}, {'amplitude': 1.5, 'flag': False})
+    exporter.write({'I': np.zeros(2)}, {'amplitude': np.int32(2),
+                                        'flag': np.bool_(True)})
+    exporter.close()
+
+    table = read(tmp_path, 'I', 'parquet').to_pydict()
+    assert table['amplitude'] == [1.0, 1.5, 2.0]
+    assert table['flag'] == [1.0, 0.0, 1.0]
+
+
+def test_non_numeric_metadata(tmp_path):
+    exporter = StreamExporter(tmp_path)
+    exporter.write({'I': np.zeros(2)}, {'value': 1j, 'items': [1, 2]})
+    exporter.close()
+
+    table = read(tmp_path, 'I', 'parquet').to_pydict()
+    assert table['value'] == ['1j']
+    assert table['items'] == ['[1, 2]']
+
+
+def test_data_cast_to_first_schema(tmp_path):
+    exporter = StreamExporter(tmp_path)
+    exporter.write({'I': np.zeros(2)}, {'point': 0})
+    exporter.write({'I': np.arange(2)}, {'point': 1})
+    exporter.close()
+
+    table = read(tmp_path, 'I', 'parquet').to_pydict()
+    assert table['data'] == [[0.0, 0.0], [0.0, 1.0]]
+
+
+def test_incompatible_layout_raises(tmp_path):
+    exporter = StreamExporter(tmp_path)
+    exporter.write({'I': np.zeros(2)}, {'point': 0})
+    with pytest.raises(ValueError):
+        exporter.write({'I': np.array(['a', 'b'])}, {'point': 1})
+    exporter.close()
+
+
+def test_source_buffers_can_be_reused(tmp_path):
+    exporter = StreamExporter(tmp_path)
+    buffer = np.arange(3.)
+    exporter.write({'I': buffer}, {'point': 0})
+    buffer[:] = -1
+    exporter.write({'I': buffer}, {'point': 1})
+    exporter.close()
+
+    table = read(tmp_path, 'I', 'parquet').to_pydict()
+    assert table['data'] == [[0.0, 1.0, 2.0], [-1.0] * 3]
+
+
+def test_write_from_buffer_fields(tmp_path):
+    buffer = np.zeros(1, dtype=[('I', 'f8', (2, 3)), ('k', '>i4', (2,))])
+    buffer['I'][0] = np.arange(6.).reshape(2, 3)
+    buffer['k'][0] = [1, 2]
+    exporter = StreamExporter(tmp_path, 'arrow')
+    exporter.write({name: buffer[name][0] for name in buffer.dtype.names},
+                   {'point': 0})
+    exporter.close()
+
+    assert read(tmp_path, 'I', 'arrow')['data'].to_pylist() == [
+        list(range(6))]
+    assert read(tmp_path, 'k', 'arrow')['data'].to_pylist() == [[1, 2]]
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        StreamExporter(tmp_path, 'csv')
@@ -0,0 +1,67 @@
+"""Tests for the construction of the next point in a worker process.
+
+"""
+import pytest
+
+from exopy_qm.utils.prefetch import PointPrefetcher
+
+CONFIG = '''
+def get_config(parameters):
+    return {'amplitude': parameters['amplitude']}
+'''
+
+PROGRAM = '''
+def get_prog(parameters):
+    if parameters['amplitude'] < 0:
+        raise ValueError('Negative amplitude')
+    return 2 * parameters['amplitude']
+'''
+
+
+@pytest.fixture
+def prefetcher(tmp_path):
+    config, program = tmp_path / 'config.py', tmp_path / 'program.py'
+    config.write_text(CONFIG)
+    program.write_text(PROGRAM)
+    prefetcher = PointPrefetcher(str(config), str(program))
+    yield prefetcher
+    prefetcher.close()
+
+
+def test_take(prefetcher):
+    prefetcher.submit('a', {'amplitude': 1})
+    assert prefetcher.take('a') == ({'amplitude': 1}, 2)
+    # A point can only be taken once.
+    assert prefetcher.take('a') is None
+
+
+def test_take_other_key(prefetcher):
+    prefetcher.submit('a', {'amplitude': 1})
+    assert prefetcher.take('b') is None
+    # The point built for another key is discarded.
+    assert prefetcher.take('a') is None
+
+
+def test_take_without_submission(prefetcher):
+    assert prefetcher.take('a') is None
+
+
+def test_failed_build(prefetcher):
+    prefetcher.submit('a', {'amplitude': -1})
+    assert prefetcher.take('a') is None
+
+
+def test_new_submission_replaces_pending_one(prefetcher):
+    prefetcher.submit('a', {'amplitude': 1})
+    prefetcher.submit('b', {'amplitude': 2})
+    assert prefetcher.take('a') is None
+    prefetcher.submit('b', {'amplitude': 2})
+    assert prefetcher.take('b') == ({'amplitude': 2}, 4)
+
+
+def test_close_and_restart(prefetcher):
+    prefetcher.submit('a', {'amplitude': 1})
+    prefetcher.close()
+    assert prefetcher.take('a') is None
+    prefetcher.submit('a', {'amplitude': 3})
+    assert prefetcher.take('a') == ({'amplitude': 3}, 6)
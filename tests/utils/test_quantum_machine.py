@@ -0,0 +1,242 @@
+"""Tests for the management of the quantum machines by the driver.
+
+"""
+import pytest
+
+pytest.importorskip('qm')
+pytest.importorskip('exopy_hqc_legacy')
+
+from exopy_qm.instruments.drivers.QuantumMachine import QuantumMachine
+from exopy_qm.utils.calibration import CalibrationTable
+
+
+class FakeJob(object):
+
+    def __init__(self, program):
+        self.program = program
+
+
+class FakeMachine(object):
+    """Quantum machine recording the values sent to it.
+
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.closed = False
+        self.sent = []
+
+    def close(self):
+        self.closed = True
+
+    def execute(self, program, **kwargs):
+        return FakeJob(program)
+
+    def set_intermediate_frequency(self, qe, intermediate_frequency):
+        self.sent.append(('if', qe, intermediate_frequency))
+
+    def set_mixer_correction(self, mixer, intermediate_frequency,
+                             lo_frequency, values):
+        self.sent.append(('mixer', mixer, intermediate_frequency,
+                          lo_frequency, values))
+
+
+class FakeManager(object):
+    """Manager opening fake machines.
+
+    """
+
+    def __init__(self, **kwargs):
+        self.close_others = []
+        self.cleared = 0
+
+    def open_qm(self, config, close_other_machines=True):
+        self.close_others.append(close_other_machines)
+        return FakeMachine(config)
+
+    def clear_all_job_results(self):
+        self.cleared += 1
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    monkeypatch.setattr('exopy_qm.instruments.drivers.QuantumMachine.'
+                        'QuantumMachinesManager', FakeManager)
+    return QuantumMachine({'gateway_ip': '', 'gateway_port': ''})
+
+
+def test_default_machine(driver):
+    driver.set_config({'version': 1})
+    assert driver.qmm.close_others == [True]
+    assert driver.qmObj is driver.machines['']
+    assert driver.configs[''] == {'version': 1}
+
+    driver.execute_program('prog')
+    assert driver.job.program == 'prog'
+
+
+def test_named_machines(driver):
+    driver.set_config({'name': 'a'}, machine='a')
+    driver.set_config({'name': 'b'}, machine='b')
+    assert driver.qmm.close_others == [False, False]
+    assert sorted(driver.machines) == ['a', 'b']
+
+    first = driver.machines['a']
+    driver.set_config({'name': 'a2'}, machine='a')
+    assert first.closed
+    assert not driver.machines['b'].closed
+    assert driver.configs['a'] == {'name': 'a2'}
+
+
+def test_default_machine_keeps_named_ones(driver):
+    driver.set_config({}, machine='a')
+    driver.set_config({})
+    default = driver.qmObj
+    driver.set_config({})
+    assert driver.qmm.close_others == [False, False, False]
+    assert default.closed
+    assert not driver.machines['a'].closed
+
+
+def test_default_machine_closes_others_when_alone(driver):
+    driver.set_config({})
+    driver.execute_program('prog')
+    driver.set_config({'version': 2})
+    assert driver.qmm.close_others == [True, True]
+    assert driver.job is None
+
+
+def test_clear_job_results(driver):
+    driver.set_config({}, machine='a')
+    driver.clear_job_results(machine='a')
+    assert driver.qmm.cleared == 1
+
+    driver.set_config({}, machine='b')
+    driver.clear_job_results(machine='a')
+    assert driver.qmm.cleared == 1
+
+
+def test_unknown_machine(driver):
+    driver.set_config({}, machine='a')
+    assert driver.execute_program('prog', machine='b') is None
+    assert 'b' not in driver.jobs
+
+
+def test_close_connection(driver):
+    driver.set_config({}, machine='a')
+    driver.set_config({}, machine='b')
+    machines = list(driver.machines.values())
+    driver.close_connection()
+    assert all(m.closed for m in machines)
+    assert not driver.machines and not driver.configs
+
+
+@pytest.fixture
+def config():
+    return {
+        'elements': {
+            'q1': {'mixInputs': {'mixer': 'm', 'lo_frequency': 5e9},
+                   'intermediate_frequency': 100e6},
+            'q2': {'mixInputs': {'mixer': 'm', 'lo_frequency': 5e9},
+                   'intermediate_frequency': 50e6},
+            'q3': {'mixInputs': {'mixer': 'm'},
+                   'intermediate_frequency': 50e6},
+            'rr': {'singleInput': {'port': ('con1', 1)},
+                   'intermediate_frequency': 10e6}},
+        'mixers': {'m': [{'intermediate_frequency': 100000000,
+                          'lo_frequency': 5e9,
+                          'correction': [1, 0, 0, 1]}]},
+    }
+
+
+class RecordingTable(CalibrationTable):
+    """Calibration table recording the interpolations requested.
+
+    """
+
+    def corrections(self, mixer, intermediate_frequencies, lo_frequency):
+        self.calls.append((mixer, list(intermediate_frequencies),
+                           lo_frequency))
+        return super().corrections(mixer, intermediate_frequencies,
+                                   lo_frequency)
+
+
+@pytest.fixture
+def calibrated(driver, config):
+    mixers, ifs, los, corrections = [], [], [], []
+    for lo in (5e9, 6e9):
+        for intermediate_frequency in (0.0, 100e6, 200e6):
+            mixers.append('m')
+            ifs.append(intermediate_frequency)
+            los.append(lo)
+            corrections.append([1 + intermediate_frequency / 1e9, 0, 0, 1])
+    driver.calibration = RecordingTable(mixers, ifs, los, corrections)
+    driver.calibration.calls = []
+    driver.set_config(config)
+    return driver
+
+
+def test_configured_values_seed_the_cache(driver, config):
+    driver.set_config(config)
+    # The config stores the IF of the mixer entry as an int.
+    assert not driver.set_intermediate_frequency('q1', 100000000)
+    assert not driver.set_mixer_correction('m', 100e6, 5e9, (1, 0, 0, 1))
+    assert not driver.qmObj.sent
+
+
+def test_applied_values_skipped(driver, config):
+    driver.set_config(config)
+    assert driver.set_intermediate_frequency('q1', 60e6)
+    assert not driver.set_intermediate_frequency('q1', 60e6)
+    assert driver.set_mixer_correction('m', 60e6, 5e9, [1.1, 0, 0, 1])
+    assert not driver.set_mixer_correction('m', 60e6, 5e9, (1.1, 0, 0, 1))
+    assert driver.set_mixer_correction('m', 100e6, 5e9, (1.1, 0, 0, 1))
+    assert len(driver.qmObj.sent) == 3
+
+
+def test_cache_reset_by_set_config(driver, config):
+    driver.set_config(config)
+    driver.set_intermediate_frequency('q1', 60e6)
+    driver.set_config(config)
+    assert driver.set_intermediate_frequency('q1', 60e6)
+    assert not driver.set_intermediate_frequency('q2', 50e6)
+
+
+def test_cache_per_machine(driver, config):
+    driver.set_config(config, machine='a')
+    driver.set_config(config, machine='b')
+    assert driver.set_intermediate_frequency('q1', 60e6, machine='a')
+    assert driver.set_intermediate_frequency('q1', 60e6, machine='b')
+
+
+def test_set_frequencies_grouped(calibrated):
+    sent = calibrated.set_frequencies({'q1': 100e6, 'q2': 60e6})
+    # The IF of q1 is the configured one, its correction is not.
+    assert sent == 3
+    assert calibrated.calibration.calls == [('m', [100e6, 60e6], 5e9)]
+    assert calibrated.qmObj.sent[0] == ('if', 'q2', 60e6)
+
+    assert calibrated.set_frequencies({'q1': 100e6, 'q2': 60e6}) == 0
+
+
+def test_set_frequencies_lo_override(calibrated):
+    calibrated.set_frequencies({'q1': 100e6, 'q2': 100e6}, {'q1': 6e9})
+    assert sorted(calibrated.calibration.calls) == [
+        ('m', [100e6], 5e9), ('m', [100e6], 6e9)]
+
+
+def test_set_frequencies_without_mixer(calibrated):
+    assert calibrated.set_frequencies({'rr': 20e6}) == 1
+    assert calibrated.qmObj.sent == [('if', 'rr', 20e6)]
+
+
+def test_set_frequencies_uncalibrated_mixer(driver, config):
+    driver.set_config(config)
+    assert driver.set_frequencies({'q2': 60e6}) == 1
+    assert driver.qmObj.sent == [('if', 'q2', 60e6)]
+
+
+def test_set_frequencies_missing_lo(calibrated):
+    with pytest.raises(ValueError):
+        calibrated.set_frequencies({'q3': 60e6})
+    calibrated.set_frequencies({'q3': 60e6}, {'q3': 5e9})
@@ -0,0 +1,251 @@
+"""Tests for the collection of the results into reusable buffers.
+
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from exopy_qm.utils.results import (ResultCollector, WindowCollector,
+                                    memmap_results, parse_declared_streams)
+from exopy_qm.utils.stream_analysis import StreamInfo
+
+
+class MultipleHandle(object):
+    """Handle of a stream holding all its values.
+
+    """
+
+    def __init__(self, data):
+        self.data = np.asarray(data)
+        self.fetches = []
+
+    def count_so_far(self):
+        return len(self.data)
+
+    def fetch(self, item, flat_struct=True):
+        self.fetches.append(item)
+        return self.data[item]
+
+    def fetch_all(self, flat_struct=True):
+        return self.data
+
+    def has_dataloss(self):
+        return False
+
+
+class SingleHandle(object):
+    """Handle of a stream keeping only its last value.
+
+    """
+
+    def __init__(self, data):
+        self.data = np.asarray(data)
+
+    def fetch_all(self, flat_struct=True):
+        return self.data
+
+    def has_dataloss(self):
+        return False
+
+
+class FakeRoot(object):
+
+    def __init__(self):
+        self.resources = {'files': {}}
+
+    def release(self):
+        for resource in self.resources['files'].values():
+            resource.close()
+        self.resources['files'].clear()
+
+
+def test_parse_declared_streams():
+    streams = parse_declared_streams({'I': (10, 'float64'),
+                                      'k': ((2, 3), int)})
+    assert streams['I'].shape == (10,)
+    assert streams['k'].shape == (2, 3)
+    assert streams['k'].source == 'declared'
+    assert all(info.is_static for info in streams.values())
+
+
+def test_buffer_reused():
+    collector = ResultCollector()
+    first = collector.collect([('I', SingleHandle(np.arange(4.)))])
+    second = collector.collect([('I', SingleHandle(np.ones(4)))])
+    assert first is second
+    assert collector.allocations == 1
+    np.testing.assert_array_equal(second['I'][0], np.ones(4))
+
+
+def test_buffer_reallocated_on_layout_change():
+    collector = ResultCollector()
+    collector.collect([('I', SingleHandle(np.arange(4.)))])
+    buffer = collector.collect([('I', SingleHandle(np.arange(5.)))])
+    assert collector.allocations == 2
+    assert buffer['I'].shape == (1, 5)
+
+
+def test_prepare_allocates():
+    collector = ResultCollector()
+    collector.prepare({'I': StreamInfo('I', (4,), 'float64')})
+    buffer = collector.buffer
+    assert collector.collect([('I', SingleHandle(np.ones(4)))]) is buffer
+
+
+def test_prepare_dynamic_streams():
+    collector = ResultCollector()
+    collector.prepare({'I': StreamInfo('I', (None,), 'float64', 'save_all')})
+    assert collector.buffer is None
+
+
+def test_raw_inputs_named_after_handles():
+    collector = ResultCollector()
+    buffer = collector.collect([('raw_input1', SingleHandle(np.ones(3))),
+                                ('raw_input2', SingleHandle(np.zeros(3)))])
+    assert buffer.dtype.names == ('raw_input1', 'raw_input2')
+
+
+def test_fetch_by_chunks():
+    collector = ResultCollector(chunk_size=80)
+    handle = MultipleHandle(np.arange(100.))
+    buffer = collector.collect([('I', handle)])
+    np.testing.assert_array_equal(buffer['I'][0], np.arange(100.))
+    # First sample then slices of 10 samples (80 bytes).
+    assert len(handle.fetches) == 1 + 10
+    assert not collector.partial
+
+
+def test_single_streams_not_chunked():
+    collector = ResultCollector(chunk_size=8)
+    buffer = collector.collect([('I', SingleHandle(np.arange(100.)))])
+    np.testing.assert_array_equal(buffer['I'][0], np.arange(100.))
+
+
+def test_described_streams_not_chunked():
+    collector = ResultCollector(chunk_size=8)
+    collector.prepare({'I': StreamInfo('I', (None,), 'float64', 'save')})
+    handle = MultipleHandle(np.arange(100.))
+    collector.collect([('I', handle)])
+    assert not handle.fetches
+
+
+def test_interrupted_fetch_is_partial():
+    should_stop = threading.Event()
+    should_stop.set()
+    collector = ResultCollector(chunk_size=80, should_stop=should_stop)
+    buffer = collector.collect([('I', MultipleHandle(np.arange(1, 101.)))])
+    assert collector.partial == ['I']
+    assert buffer['I'][0][0] == 1
+    assert not buffer['I'][0][1:].any()
+
+    should_stop.clear()
+    collector.collect([('I', MultipleHandle(np.arange(1, 101.)))])
+    assert not collector.partial
+
+
+def test_memmap_files_are_unique(tmp_path):
+    """Regression: collectors sharing a folder overwrote each other's data.
+
+    """
+    root = FakeRoot()
+    first, second = ResultCollector(), ResultCollector()
+    memmap_results(root, first, tmp_path)
+    memmap_results(root, second, tmp_path)
+    a = first.collect([('I', SingleHandle(np.arange(4.)))])
+    b = second.collect([('I', SingleHandle(np.ones(4)))])
+
+    assert isinstance(a, np.memmap)
+    np.testing.assert_array_equal(a['I'][0], np.arange(4.))
+    np.testing.assert_array_equal(b['I'][0], np.ones(4))
+    assert len(list(tmp_path.glob('results_*.npy'))) == 2
+
+
+def test_memmap_files_deleted_at_the_end(tmp_path):
+    root = FakeRoot()
+    collector = ResultCollector()
+    memmap_results(root, collector, tmp_path)
+    collector.collect([('I', SingleHandle(np.arange(4.)))])
+    collector.collect([('I', SingleHandle(np.arange(5.)))])
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    root.release()
+    assert not list(tmp_path.glob('*.npy'))
+    assert collector.buffer is None and collector.directory is None
+
+    # The next measurement maps the buffer again.
+    memmap_results(root, collector, tmp_path)
+    collector.collect([('I', SingleHandle(np.arange(4.)))])
+    assert len(list(tmp_path.glob('*.npy'))) == 1
+
+
+class GrowingHandle(MultipleHandle):
+    """Handle of a stream whose samples are acquired progressively.
+
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.count = 0
+
+    def count_so_far(self):
+        return self.count
+
+
+@pytest.mark.parametrize('steps', [(3, 7), (2, 4, 6, 9), (25,)])
+def test_window_collector(steps):
+    data = np.arange(1, 26.)
+    handle = GrowingHandle(data)
+    collector = WindowCollector(5)
+    for count in steps:
+        handle.count = count
+        buffer = collector.collect([('I', handle)])
+        expected = np.zeros(5)
+        last = data[max(count - 5, 0):count]
+        expected[5 - len(last):] = last
+        np.testing.assert_array_equal(buffer['I'][0], expected)
+        assert collector.acquired['I'] == count
+
+
+class Report(object):
+
+    def __init__(self, errors):
+        self._errors = errors
+
+    def has_errors(self):
+        return bool(self._errors)
+
+    def errors(self):
+        return self._errors
+
+
+def test_telemetry():
+    collector = ResultCollector()
+    collector.collect([('I', SingleHandle(np.arange(4.))),
+                       ('k', SingleHandle(np.arange(3)))])
+    telemetry = collector.telemetry
+    assert list(telemetry['stream']) == ['I', 'k']
+    assert list(telemetry['samples']) == [4, 3]
+    assert list(telemetry['bytes']) == [32, 3 * np.arange(3).itemsize]
+    assert not telemetry['dataloss'].any()
+
+
+def test_sweep_telemetry():
+    collector = ResultCollector()
+    for _ in range(3):
+        collector.collect([('I', SingleHandle(np.arange(4.)))])
+    sweep, = collector.sweep_telemetry()
+    assert sweep['stream'] == 'I'
+    assert sweep['points'] == 3
+    assert sweep['samples'] == 12
+    assert sweep['bytes'] == 96
+
+
+def test_execution_errors():
+    collector = ResultCollector()
+    collector.collect([('I', SingleHandle(np.arange(4.)))],
+                      Report(['overflow']))
+    assert collector.errors == ['overflow']
+    collector.collect([('I', SingleHandle(np.arange(4.)))], Report([]))
+    assert collector.errors == []
+    assert collector.error_count == 1
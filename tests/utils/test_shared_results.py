@@ -0,0 +1,137 @@
+"""Tests for the publication of the streams in shared memory.
+
+"""
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from exopy_qm.utils.shared_results import (HEADER_SIZE, SharedStreamPublisher,
+                                           SharedStreamReader, _U64, _created,
+                                           open_publisher)
+
+
+@pytest.fixture
+def prefix():
+    return f'exopy_qm_test_{os.getpid()}'
+
+
+@pytest.fixture
+def publisher(prefix):
+    publisher = SharedStreamPublisher(prefix, slots=2)
+    yield publisher
+    publisher.close()
+
+
+@pytest.fixture
+def reader(publisher, prefix):
+    reader = SharedStreamReader(prefix)
+    yield reader
+    reader.close()
+
+
+def test_publish_and_read(publisher, reader):
+    assert reader.streams == []
+    publisher.publish({'I': np.arange(3.), 'k': np.arange(2)})
+    assert sorted(reader.streams) == ['I', 'k']
+    assert reader.active
+
+    sequence, data = reader.latest('I')
+    assert sequence == 1
+    np.testing.assert_array_equal(data, np.arange(3.))
+
+    publisher.publish({'I': np.ones(3), 'k': np.arange(2)})
+    sequence, data = reader.latest('I')
+    assert sequence == 2
+    np.testing.assert_array_equal(data, np.ones(3))
+    assert reader.sequence('k') == 2
+
+
+def test_view_validity(publisher, reader):
+    publisher.publish({'I': np.arange(3.)})
+    sequence, view = reader.latest('I', copy=False)
+    assert reader.is_valid('I', sequence)
+    # The ring has 2 slots, the item is overwritten by the third one.
+    publisher.publish({'I': np.ones(3)})
+    assert reader.is_valid('I', sequence)
+    publisher.publish({'I': np.zeros(3)})
+    assert not reader.is_valid('I', sequence)
+
+
+def test_layout_change(publisher, reader):
+    publisher.publish({'I': np.arange(3.)})
+    reader.latest('I')
+    publisher.publish({'I': np.arange(5)})
+    sequence, data = reader.latest('I')
+    np.testing.assert_array_equal(data, np.arange(5))
+
+
+def test_latest_times_out(publisher, reader):
+    publisher.publish({'I': np.arange(3.)})
+    reader.streams
+    # Simulate an item constantly being overwritten.
+    ring = reader._rings['I']
+    _U64.pack_into(ring.shm.buf, HEADER_SIZE, 0)
+    with pytest.raises(TimeoutError):
+        reader.latest('I', timeout=0.01)
+
+
+def test_latest_after_close(prefix):
+    publisher = SharedStreamPublisher(prefix)
+    reader = SharedStreamReader(prefix)
+    try:
+        publisher.publish({'I': np.arange(3.)})
+        reader.streams
+        publisher.close()
+        assert not reader.active
+        assert reader.latest('I') == (0, None)
+    finally:
+        publisher.close()
+        reader.close()
+
+
+def test_open_publisher(prefix):
+    class Root(object):
+        resources = {'files': {}}
+
+    publisher = open_publisher(Root, prefix, 3)
+    try:
+        assert open_publisher(Root, prefix, 3) is publisher
+        assert publisher.slots == 3
+    finally:
+        publisher.close()
+
+
+READER = """
+import sys
+from exopy_qm.utils.shared_results import SharedStreamReader
+reader = SharedStreamReader(sys.argv[1])
+print(reader.latest('I')[1].tolist())
+reader.close()
+"""
+
+
+def test_reader_in_other_process(publisher, prefix):
+    publisher.publish({'I': np.arange(3.)})
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.run([sys.executable, '-c', READER, prefix],
+                             capture_output=True, text=True, env=env,
+                             timeout=60)
+    assert process.stdout.strip() == '[0.0, 1.0, 2.0]', process.stderr
+    assert 'leaked' not in process.stderr
+    # The segments outlive the reader process.
+    reader = SharedStreamReader(prefix)
+    try:
+        np.testing.assert_array_equal(reader.latest('I')[1], np.arange(3.))
+    finally:
+        reader.close()
+
+
+def test_segments_forgotten_once_unlinked(prefix):
+    publisher = SharedStreamPublisher(prefix)
+    publisher.publish({'I': np.arange(3.)})
+    assert any(name.startswith(prefix) for name in _created)
+    publisher.close()
+    assert not any(name.startswith(prefix) for name in _created)
@@ -0,0 +1,86 @@
+"""Tests for the simulation of a grid of parameters.
+
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from exopy_qm.utils.simulation import (SimulationBatch, _metrics,
+                                       parameter_grid, simulate_grid,
+                                       simulated_channels)
+
+
+def test_parameter_grid_product():
+    points = parameter_grid({'a': 0, 'b': 0, 'c': 1},
+                            {'a': [1, 2], 'b': [3, 4]})
+    assert points == [{'a': 1, 'b': 3, 'c': 1}, {'a': 1, 'b': 4, 'c': 1},
+                      {'a': 2, 'b': 3, 'c': 1}, {'a': 2, 'b': 4, 'c': 1}]
+
+
+def test_parameter_grid_list():
+    base = {'a': 0, 'b': 0}
+    points = parameter_grid(base, [{'a': 1}, {'b': 2}])
+    assert points == [{'a': 1, 'b': 0}, {'a': 0, 'b': 2}]
+    assert base == {'a': 0, 'b': 0}
+
+
+def test_metrics():
+    channels = {'a': np.array([0, 1, 1, 0, 0, 2, 0]),
+                'b': np.array([0, 0, 0, 0, 0, 0, 0, 0, 3])}
+    # Pulses over [1, 3), [5, 6) and [8, 9).
+    assert _metrics(channels) == (9, 1, 9, 3)
+
+
+def test_metrics_pulse_at_start():
+    assert _metrics({'a': np.array([1, 0, 1])}) == (3, 0, 3, 2)
+
+
+def test_metrics_no_pulse():
+    assert _metrics({}) == (0, -1, -1, 0)
+    assert _metrics({'a': np.zeros(5)}) == (5, -1, -1, 0)
+
+
+def test_simulation_batch():
+    channels = [{'a': np.ones(3)}, None,
+                {'a': np.arange(5.), 'b': np.array([0, 1])}]
+    batch = SimulationBatch([{'p': 0}, {'p': 1}, {'p': 2}], channels,
+                            ['', 'Compilation failed', ''])
+
+    assert batch.samples['a'].shape == (3, 5)
+    np.testing.assert_array_equal(batch.samples['a'][0], [1, 1, 1, 0, 0])
+    assert not batch.samples['a'][1].any()
+    np.testing.assert_array_equal(batch.samples['b'][2], [0, 1])
+    assert not batch.samples['b'][0].any()
+
+    assert list(batch.metrics['point']) == [0, 1, 2]
+    assert list(batch.metrics['duration']) == [3, 0, 5]
+    assert list(batch.metrics['pulses']) == [1, 0, 1]
+    assert list(batch.metrics['error']) == ['', 'Compilation failed', '']
+
+
+def test_simulated_channels():
+    controller = SimpleNamespace(analog={'1': [0.0, 0.1]},
+                                 digital={'1': [False, True]})
+    samples = SimpleNamespace(_controllers={'con1': controller})
+    channels = simulated_channels(samples)
+    assert sorted(channels) == ['con1:analog:1', 'con1:digital:1']
+    np.testing.assert_array_equal(channels['con1:analog:1'], [0.0, 0.1])
+
+
+class FakeDriver(object):
+
+    def simulate(self, config, program, duration):
+        if program is None:
+            raise RuntimeError('Invalid program')
+        controller = SimpleNamespace(analog={'1': np.full(duration, config)},
+                                     digital={})
+        samples = SimpleNamespace(con1=controller)
+        return SimpleNamespace(get_simulated_samples=lambda: samples)
+
+
+def test_simulate_grid():
+    points = [(1., 'p'), (2., None), (3., 'p')]
+    channels, errors = simulate_grid(FakeDriver(), points, 4, max_workers=2)
+    assert errors == ['', 'Invalid program', '']
+    assert channels[1] is None
+    np.testing.assert_array_equal(channels[2]['con1:analog:1'], [3.] * 4)
@@ -0,0 +1,45 @@
+"""Tests for the running statistics used for early stopping.
+
+"""
+import numpy as np
+
+from exopy_qm.utils.statistics import RunningStats
+
+
+def test_batches_match_direct_computation():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(1.0, 2.0, size=(1000, 3))
+    stats = RunningStats()
+    for batch in np.array_split(samples, [1, 10, 300, 301]):
+        stats.update(batch)
+
+    assert stats.count == 1000
+    np.testing.assert_allclose(stats.mean, samples.mean(axis=0))
+    np.testing.assert_allclose(stats.variance, samples.var(axis=0, ddof=1))
+    np.testing.assert_allclose(stats.standard_error,
+                               samples.std(axis=0, ddof=1) / np.sqrt(1000))
+
+
+def test_empty_batches_ignored():
+    stats = RunningStats()
+    stats.update(np.zeros((0, 2)))
+    assert stats.count == 0
+    assert stats.mean is None
+
+
+def test_not_enough_samples():
+    stats = RunningStats()
+    stats.update([1.0])
+    assert stats.variance == np.inf
+    assert stats.standard_error == np.inf
+    assert stats.snr == 0.0
+
+
+def test_snr():
+    stats = RunningStats()
+    stats.update([[1.0, 0.0], [3.0, 0.0]])
+    np.testing.assert_allclose(stats.snr, [2.0, 0.0])
+
+    constant = RunningStats()
+    constant.update([1.0, 1.0])
+    assert constant.snr == np.inf
@@ -0,0 +1,98 @@
+"""Tests for the static discovery of the streams of a QUA program.
+
+"""
+import pytest
+
+from exopy_qm.utils.stream_analysis import find_streams
+
+PROGRAM = '''
+from qm.qua import *
+
+PREFIX = 'q'
+
+
+def tag(i):
+    return f'{PREFIX}_{i}'
+
+
+def get_prog(parameters):
+    n = parameters['n']
+    with program() as prog:
+        I = declare(fixed)
+        k = declare(int)
+        I_st = declare_stream()
+        k_st = declare_stream()
+        with for_(k, 0, k < 100, k + 1):
+            measure('readout', 'rr', 'raw', demod.full('cos', I))
+            save(I, I_st)
+            save(k, k_st)
+            save(I, 'direct')
+        with stream_processing():
+            I_st.buffer(100).average().save('I_avg')
+            I_st.save_all('I_all')
+            k_st.buffer(10).save_all('k_all')
+            I_st.buffer(n).save('I_n')
+            I_st.save(tag(1))
+            I_st.save('{}_avg'.format(PREFIX))
+    return prog
+'''
+
+
+@pytest.fixture(scope='module')
+def streams():
+    return find_streams(PROGRAM)
+
+
+def test_stream_names(streams):
+    assert set(streams) == {'raw_input1', 'raw_input2', 'direct', 'I_avg',
+                            'I_all', 'k_all', 'I_n', 'q_1', 'q_avg'}
+
+
+def test_static_shapes_and_dtypes(streams):
+    assert streams['I_avg'].shape == (100,)
+    assert streams['I_avg'].dtype == 'float64'
+    assert streams['I_avg'].is_static
+    assert streams['q_1'].shape == ()
+    assert streams['k_all'].shape == (None, 10)
+    assert streams['k_all'].dtype == 'int64'
+
+
+def test_dynamic_shapes(streams):
+    assert streams['I_all'].shape == (None,)
+    assert streams['I_n'].shape == (None,)
+    assert not streams['I_all'].is_static
+    assert not streams['I_n'].is_static
+
+
+def test_raw_adc_inputs(streams):
+    for name in ('raw_input1', 'raw_input2'):
+        assert streams[name].source == 'adc'
+        assert streams[name].accumulates
+
+
+def test_sources(streams):
+    assert streams['direct'].source == 'tag'
+    assert streams['I_all'].source == 'save_all'
+    assert streams['I_avg'].source == 'save'
+    assert streams['direct'].accumulates
+    assert streams['I_all'].accumulates
+    assert not streams['I_avg'].accumulates
+
+
+def test_conflicting_descriptions():
+    source = '''
+with program() as prog:
+    I = declare(fixed)
+    I_st = declare_stream()
+    save(I, I_st)
+    with stream_processing():
+        I_st.buffer(10).save('I')
+        I_st.buffer(20).save('I')
+'''
+    info = find_streams(source)['I']
+    assert info.shape is None and info.dtype is None
+
+
+def test_syntax_error():
+    with pytest.raises(SyntaxError):
+        find_streams('def get_prog(:')
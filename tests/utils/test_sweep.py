@@ -0,0 +1,122 @@
+"""Tests for the anticipation of the next point of a loop.
+
+"""
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('exopy')
+
+from exopy_qm.utils.sweep import (QueuedJob, eval_with_overrides,
+                                  loop_indices, loop_values,
+                                  next_point_overrides, runs_alone_in_loop)
+
+
+class FakeTask(object):
+    """Task sharing a flat database with its ancestors.
+
+    """
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.database = parent.database if parent else {}
+        if parent is not None:
+            parent.children.append(self)
+
+    def get_from_database(self, entry):
+        return self.database[entry]
+
+    def format_and_eval_string(self, string):
+        return eval(string)
+
+
+class FakeLoop(FakeTask):
+
+    task = None
+
+    def __init__(self, name, parent=None, interface=None):
+        super().__init__(name, parent)
+        self.interface = interface or SimpleNamespace(start='0', stop='1',
+                                                      step='0.1')
+
+    def perform_loop(self):
+        pass
+
+
+def test_linspace_values_rounded():
+    values = loop_values(FakeLoop('loop'))
+    assert len(values) == 11
+    assert values[3] == 0.3
+    assert values[-1] == 1.0
+
+
+def test_iterable_values():
+    loop = FakeLoop('loop', interface=SimpleNamespace(iterable='(1, 5, 2)'))
+    assert loop_values(loop) == [1, 5, 2]
+
+
+def test_unsupported_interface():
+    assert loop_values(FakeLoop('loop', interface=SimpleNamespace())) is None
+
+
+def test_next_point_overrides():
+    loop = FakeLoop('loop')
+    task = FakeTask('task', loop)
+    # exopy loops count their iterations from 1.
+    loop.database['loop_index'] = 3
+    assert next_point_overrides(task) == {'loop_index': 4, 'loop_value': 0.3}
+
+    loop.database['loop_index'] = 11
+    assert next_point_overrides(task) is None
+
+
+def test_no_next_point():
+    assert next_point_overrides(FakeTask('task')) is None
+
+    loop = FakeLoop('loop')
+    loop.task = FakeTask('embedded')
+    loop.database['loop_index'] = 1
+    assert next_point_overrides(FakeTask('task', loop)) is None
+
+    # Missing index.
+    assert next_point_overrides(FakeTask('task', FakeLoop('other'))) is None
+
+
+def test_eval_with_overrides():
+    task = FakeTask('task')
+    task.database.update({'loop_value': 0.1, 'amplitude': 2})
+    assert eval_with_overrides(task, '{loop_value} * {amplitude}',
+                               {'loop_value': 0.5}) == 1.0
+    assert eval_with_overrides(task, '{loop_value} + {loop_value}',
+                               {}) == 0.2
+
+
+def test_runs_alone_in_loop():
+    loop = FakeLoop('loop')
+    complex_task = FakeTask('complex', loop)
+    task = FakeTask('task', complex_task)
+    assert runs_alone_in_loop(task)
+
+    FakeTask('other', complex_task)
+    assert not runs_alone_in_loop(task)
+
+    assert not runs_alone_in_loop(FakeTask('task'))
+
+
+def test_loop_indices():
+    outer = FakeLoop('outer')
+    inner = FakeLoop('inner', outer)
+    task = FakeTask('task', inner)
+    outer.database.update({'outer_index': 2, 'inner_index': 5})
+    assert loop_indices(task) == {'inner_index': 5, 'outer_index': 2}
+
+
+def test_queued_job_cancelled_once():
+    cancelled = []
+    driver = SimpleNamespace(cancel_job=cancelled.append)
+    job = QueuedJob(driver, 'digest', 'pending')
+    job.close()
+    job.close()
+    assert cancelled == ['pending']